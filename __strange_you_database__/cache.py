@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 登录主体缓存的默认有效期（秒）与容量
+PRINCIPAL_CACHE_TTL = 300
+PRINCIPAL_CACHE_SIZE = 10000
+
+_MISSING = object()
+
+
+# 带过期时间的 LRU 缓存，超出容量时淘汰最久未使用的条目，并统计命中/未命中次数。
+# on_evict(key) 在条目因容量或过期被移除时调用（不含主动失效）
+class LRUCache:
+
+    def __init__(self, maxsize: int, ttl: float, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+        if item is not _MISSING and self.on_evict:
+            self.on_evict(key)
+        return default
+
+    # 读取但不计入命中统计、不调整淘汰顺序，供写路径增量更新时使用
+    def peek(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[1] <= time.monotonic():
+                return default
+            return item[0]
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self.on_evict:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    # 替换已有条目的值，保留原有的过期时间
+    def replace(self, key, value):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                self._data[key] = (value, item[1])
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# 前台用户与后台管理员的登录主体缓存，键为令牌中的学工号
+user_cache = LRUCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+manager_cache = LRUCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -1,16 +1,50 @@
+import logging
 import random
-from datetime import date
+from array import array
+from datetime import date, datetime
 
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, and_, case, insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, contains_eager
 from __strange_you_database__ import models
-from __strange_you_database__.database import SessionLocal
+from __strange_you_database__.database import SessionLocal, ReadSessionLocal
+from __strange_you_database__.cache import user_cache, manager_cache
+from __strange_you_database__.reply_index import reply_index
+from __strange_you_database__.page_index import page_index, QUESTION_PAGES, REPLY_PAGES, PAGE_INDEX_MIN_SKIP
+from __strange_you_database__.sampler import question_pool, SCREEN_BATCH_SIZE
+from __strange_you_database__.search import search_backend
+from __strange_you_database__.response_cache import response_cache, question_tag, reply_tag, SEARCH_TAG
+from __strange_you_database__.pubsub import broker, user_channel
+from __strange_you_database__.revocation import token_epochs, USER_TOKEN, MANAGER_TOKEN
+from __strange_you_database__.moderation import leased_by_other
 from fastapi import Depends, HTTPException
-from typing import List
+from typing import List, Optional
 from __strange_you_database__.models import *
 from __strange_you_database__.schemas import *
 
+logger = logging.getLogger(__name__)
+
+
+# 各列表接口返回的列，只查询这些列并以字典返回，不构造 ORM 对象
+QUESTION_COLUMNS = (Question.sn, Question.question, Question.source, Question.name, Question.status, Question.date)
+REPLY_COLUMNS = (Reply.id, Reply.name, Reply.content, Reply.source, Reply.status, Reply.date, Reply.question_id)
+
+
+def as_dicts(rows):
+    return [dict(row._mapping) for row in rows]
+
+
+# 内容变化后失效相关的响应缓存
+def invalidate_responses(question_sns=(), reply_ids=()):
+    response_cache.invalidate(SEARCH_TAG, *[question_tag(sn) for sn in question_sns],
+                              *[reply_tag(reply_id) for reply_id in reply_ids])
+
+
+# 使后台回复列表的页边界失效，question_sns 为有回复被删除的问题
+def invalidate_reply_pages(question_sns):
+    for question_sn in question_sns:
+        page_index.invalidate((REPLY_PAGES, question_sn))
+
 
 def get_db():
     db = SessionLocal()
@@ -20,6 +54,15 @@ def get_db():
         db.close()
 
 
+# 只读接口使用的会话，配置了只读副本时查询走副本
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def get_users(db: Session, skip=0, limit=0):  # 查询所有用户
     return db.query(models.User).offset(skip).limit(limit).all()
 
@@ -83,23 +126,68 @@ def delete_user(user_student_number=int, db=Depends(get_db)):  # 删除用户
     if not user:
         raise HTTPException(detail="用户不存在,删除失败", status_code=400)
     db.delete(user)
+    epochs = token_epochs.bump(db, USER_TOKEN, [str(user_student_number)])
     db.commit()
+    token_epochs.apply(epochs)
+    user_cache.invalidate(str(user_student_number))
     return {"detail": "删除成功"}
 
 
 def deleteUser(user_student_numbers: List[int], db=Depends(get_db)):  # 删除多个用户
     try:
-        for user_student_number in user_student_numbers:
-            users = db.query(models.User).filter(models.User.student_number == user_student_number).first()
-            if users:
-                db.delete(users)
-                db.commit()
-                db.close()
-        return {"code": "0000", "message": "删除成功"}
-    except ArithmeticError:
+        summary = delete_users(db, [str(user_student_number) for user_student_number in user_student_numbers])
+        return {"code": "0000", "message": "删除成功", "data": summary}
+    except SQLAlchemyError:
+        db.rollback()
         return {"code": "0002", "message": "数据库错误"}
 
 
+# 批量删除用户，连同其提出的问题、发出的回复以及其问题下的回复一起删除。
+# 每 chunk_size 个学号一个事务，progress(已处理数, 总数) 用于汇报进度
+def delete_users(db: Session, student_numbers: List[str], chunk_size: int = 500, progress=None):
+    summary = {"users": 0, "questions": 0, "replies": 0}
+    student_numbers = list(dict.fromkeys(student_numbers))
+    for start in range(0, len(student_numbers), chunk_size):
+        chunk = student_numbers[start:start + chunk_size]
+        users = [sn for sn, in db.query(User.student_number).filter(User.student_number.in_(chunk))]
+        if users:
+            question_sns = [sn for sn, in db.query(Question.sn).filter(Question.source.in_(users))]
+            owned = or_(Reply.source.in_(users), Reply.question_id.in_(question_sns))
+            replies = db.query(Reply.id, Reply.question_id, Reply.status).filter(owned).all()
+            # 被删问题的计数随问题一起删除，只需调整其他问题的计数
+            deleted = set(question_sns)
+            adjust_reply_counters(db, [(question_id, status, -1) for _, question_id, status in replies
+                                       if question_id not in deleted])
+            db.query(Reply).filter(owned).delete(synchronize_session=False)
+            db.query(Question).filter(Question.sn.in_(question_sns)).delete(synchronize_session=False)
+            db.query(User).filter(User.student_number.in_(users)).delete(synchronize_session=False)
+            epochs = token_epochs.bump(db, USER_TOKEN, users)
+            db.commit()
+            token_epochs.apply(epochs)
+            for reply_id, question_id, _ in replies:
+                reply_index.discard(question_id, reply_id)
+                search_backend.remove("reply", reply_id)
+            for question_sn in question_sns:
+                question_pool.discard(question_sn)
+                reply_index.invalidate(question_sn)
+                search_backend.remove("question", question_sn)
+            page_index.invalidate(QUESTION_PAGES)
+            invalidate_reply_pages({question_id for _, question_id, _ in replies} | deleted)
+            reply_index.broadcast({question_id for _, question_id, _ in replies} | deleted)
+            invalidate_responses({question_id for _, question_id, _ in replies} | deleted,
+                                 [reply_id for reply_id, _, _ in replies])
+            for student_number in users:
+                user_cache.invalidate(student_number)
+            summary["users"] += len(users)
+            summary["questions"] += len(question_sns)
+            summary["replies"] += len(replies)
+        done = min(start + chunk_size, len(student_numbers))
+        logger.info("批量删除用户进度 %d/%d", done, len(student_numbers))
+        if progress:
+            progress(done, len(student_numbers))
+    return summary
+
+
 def get_source_question(db: Session, source: str):  # 查询问题
     return db.query(models.Question).filter(models.Question.source == source).all()
 
@@ -112,11 +200,11 @@ def get_source_reply(db: Session, source: str):  # 查询回复
 def updateUser(user_student_number=int, user_name=str, db=Depends(get_db)):
     try:
         user = db.query(models.User).filter(models.User.student_number == user_student_number).first()
-        print(user)
         if user:
-            models.User.name = user_name
+            user.username = user_name
             db.commit()
             db.close()
+            user_cache.invalidate(str(user_student_number))
             return {"code": "0000", "message": "修改成功"}
         else:
             return {"code": "0001", "message": "学工号或昵称错误"}
@@ -156,8 +244,12 @@ def add_manager(db: Session, student_number: str, name: str, hashed_password: st
 def change_manager_password(db: Session, student_number: str, hashed_password: str):
     manager = get_manager(db, student_number)
     manager.hashed_password = hashed_password
+    epochs = token_epochs.bump(db, MANAGER_TOKEN, [student_number])
     db.commit()
+    token_epochs.apply(epochs)
     db.refresh(manager)
+    manager_cache.invalidate(student_number)
+    return epochs[(MANAGER_TOKEN, student_number)]
 
 
 # 根据序号查找问题
@@ -165,19 +257,55 @@ def get_sn_question(db: Session, question_sn: int):
     return db.query(models.Question).filter(models.Question.sn == question_sn).first()
 
 
-# 分页查找问题
+# 按游标分页查找问题，按序号升序，after_sn 为上一页最后一个问题的序号
+def get_questions_after(db: Session, after_sn: Optional[int], limit: int):
+    query = db.query(*QUESTION_COLUMNS)
+    if after_sn is not None:
+        query = query.filter(Question.sn > after_sn)
+    return as_dicts(query.order_by(Question.sn).limit(limit))
+
+
+# 后台问题列表全部问题的序号，按序号升序
+def get_question_page_keys(db: Session):
+    return page_index.keys(QUESTION_PAGES, lambda: array("q", (sn for sn, in db.query(Question.sn)
+                                                                 .order_by(Question.sn))))
+
+
+# 分页查找问题：先定位上一页最后一个序号，再按游标取整页。
+# 浅页在覆盖索引上 OFFSET 定位；深页从页边界缓存取，缓存之后新提交的问题排在末尾，从缓存末尾起 OFFSET
 def get_questions(db: Session, page: int, limit: int):
     skip = (page - 1) * limit
-    return db.query(Question).offset(skip).limit(limit).all()
+    if skip <= 0:
+        return get_questions_after(db, None, limit)
+    query = db.query(Question.sn)
+    if skip >= PAGE_INDEX_MIN_SKIP:
+        keys = get_question_page_keys(db)
+        if skip <= len(keys):
+            return get_questions_after(db, keys[skip - 1], limit)
+        if keys:
+            query = query.filter(Question.sn > keys[-1])
+            skip -= len(keys)
+    boundary = query.order_by(Question.sn).offset(skip - 1).limit(1).scalar()
+    if boundary is None:
+        return []
+    return get_questions_after(db, boundary, limit)
 
 
 # 管理员删除回复
 def delete_reply_by_manager(ids: list, db: Session):
+    replies = db.query(Reply.id, Reply.question_id, Reply.status).filter(Reply.id.in_(ids)).all()
+    adjust_reply_counters(db, [(question_id, status, -1) for _, question_id, status in replies])
     content = db.query(Reply).filter(Reply.id.in_(ids)).delete()
     # if not content:
     #     raise HTTPException(detail="回复不存在,删除失败", status_code=400)
     # db.delete(content)
     db.commit()
+    for reply_id, question_id, _ in replies:
+        reply_index.discard(question_id, reply_id)
+        search_backend.remove("reply", reply_id)
+    invalidate_reply_pages({question_id for _, question_id, _ in replies})
+    reply_index.broadcast({question_id for _, question_id, _ in replies})
+    invalidate_responses({question_id for _, question_id, _ in replies}, [reply_id for reply_id, _, _ in replies])
     return content
 
 
@@ -188,29 +316,64 @@ def delete_reply(reply_id: int, source: str, db: Session):  # 删除回复
         raise HTTPException(detail="回复不存在,删除失败", status_code=400)
     if content.source != source:
         raise HTTPException(status_code=401, detail="权限不足，删除失败")
+    question_id = content.question_id
+    adjust_reply_counters(db, [(question_id, content.status, -1)])
     db.delete(content)
     db.commit()
+    reply_index.discard(question_id, reply_id)
+    search_backend.remove("reply", reply_id)
+    invalidate_reply_pages([question_id])
+    reply_index.broadcast([question_id])
+    invalidate_responses([question_id], [reply_id])
     return {"detail": "删除成功"}
 
 
 # 查看自己提出的问题
 def get_ones_questions(db: Session, source: str):
-    return db.query(Question).filter(Question.source == source).all()
+    return as_dicts(db.query(Question.sn, Question.question, Question.name, Question.status, Question.date)
+                    .filter(Question.source == source))
+
+
+# 按游标分页查看自己提出的问题，只查询响应需要的列，按序号倒序，after 为上一页最后一个问题的序号
+def get_ones_questions_after(db: Session, source: str, after: Optional[int], limit: int):
+    query = db.query(Question.sn, Question.question, Question.name, Question.status, Question.date) \
+        .filter(Question.source == source)
+    if after is not None:
+        query = query.filter(Question.sn < after)
+    return as_dicts(query.order_by(Question.sn.desc()).limit(limit))
+
+
+# 一次聚合查询各问题最新一条已通过回复的 id，没有已通过回复的问题不在结果中
+def get_latest_reply_ids(db: Session, question_sns: List[int]):
+    if not question_sns:
+        return {}
+    return dict(db.query(Reply.question_id, func.max(Reply.id))
+                .filter(Reply.question_id.in_(question_sns), Reply.status == "已通过")
+                .group_by(Reply.question_id).all())
 
 
 # 查看弹幕墙上的问题
 def get_screen_questions(db: Session):
-    total_count = db.query(func.count(Question.sn)).scalar()
-    if total_count <= 14:
-        random_offset = 1
-    else:
-        random_offset = random.randint(1, total_count - 14)
-    return db.query(Question).filter(Question.status == "已通过").offset(random_offset - 1).limit(11).all()
+    question_pool.ensure_loaded(db)
+    sns = question_pool.sample(SCREEN_BATCH_SIZE)
+    if not sns:
+        return []
+    # 状态条件用于兜底其他进程刚刚撤下的问题
+    return as_dicts(db.query(Question.sn, Question.question, Question.name)
+                    .filter(Question.sn.in_(sns), Question.status == "已通过"))
 
 
 # 查看自己发出的回复
 def get_ones_replies(db: Session, source: str):
-    return db.query(Reply).filter(Reply.source == source).all()
+    return as_dicts(db.query(Reply.id, Reply.name, Reply.question_id).filter(Reply.source == source))
+
+
+# 按游标分页查看自己发出的回复，按 id 倒序，after 为上一页最后一条回复的 id
+def get_ones_replies_after(db: Session, source: str, after: Optional[int], limit: int):
+    query = db.query(Reply.id, Reply.name, Reply.question_id).filter(Reply.source == source)
+    if after is not None:
+        query = query.filter(Reply.id < after)
+    return as_dicts(query.order_by(Reply.id.desc()).limit(limit))
 
 
 # 查找问题的所有回复
@@ -218,16 +381,87 @@ def get_all_replies(db: Session, question_sn: int):
     return db.query(Reply).filter(Reply.question_id == question_sn).all()
 
 
-# 分页查找对应问题的回复
+# 按游标分页查找对应问题的回复，按 (date, id) 倒序，after 为上一页最后一条回复的 (date, id)
+def get_reply_after(db: Session, question_sn: int, after: Optional[tuple], limit: int):
+    query = db.query(*REPLY_COLUMNS).filter(Reply.question_id == question_sn)
+    if after is not None:
+        after_date, after_id = after
+        # 冗余的 date <= after_date 让 (question_id, date, id) 索引从游标处开始范围扫描，而不是从头跳过前面的行
+        query = query.filter(Reply.date <= after_date,
+                             or_(Reply.date < after_date, and_(Reply.date == after_date, Reply.id < after_id)))
+    return as_dicts(query.order_by(Reply.date.desc(), Reply.id.desc()).limit(limit))
+
+
+# 后台回复列表中问题全部回复的 (date, id)，按 (date, id) 升序，新回复追加在末尾之后
+def get_reply_page_keys(db: Session, question_sn: int):
+    return page_index.keys((REPLY_PAGES, question_sn), lambda: [
+        tuple(key) for key in db.query(Reply.date, Reply.id).filter(Reply.question_id == question_sn)
+        .order_by(Reply.date, Reply.id)])
+
+
+# 分页查找对应问题的回复：先定位上一页最后一条回复的 (date, id)，再按游标取整页。
+# 浅页在覆盖索引上 OFFSET 定位；深页从页边界缓存取，列表按倒序展示，
+# 倒序第 skip 条在升序缓存中的位置是 回复总数 - skip，缓存之后的新回复只影响最前面的几页
 def get_reply(db: Session, question_sn: int, page: int, limit: int):
     skip = (page - 1) * limit
-    return db.query(Reply).filter(Reply.question_id == question_sn).order_by(Reply.date.desc()) \
-        .offset(skip).limit(limit).all()
+    if skip <= 0:
+        return get_reply_after(db, question_sn, None, limit)
+    if skip >= PAGE_INDEX_MIN_SKIP:
+        keys = get_reply_page_keys(db, question_sn)
+        position = get_reply_num(db, question_sn)[0] - skip
+        if position < 0:
+            return []
+        if position < len(keys):
+            return get_reply_after(db, question_sn, keys[position], limit)
+    boundary = db.query(Reply.date, Reply.id).filter(Reply.question_id == question_sn) \
+        .order_by(Reply.date.desc(), Reply.id.desc()).offset(skip - 1).limit(1).first()
+    if boundary is None:
+        return []
+    return get_reply_after(db, question_sn, tuple(boundary), limit)
+
+
+# 通过问题分页查回复（新），从第 id 条已通过的回复开始取 count 条
+def get_replies_by_question(db: Session, id: int, sn: int, count: int = 1):
+    if id < 1:
+        return []
+    reply_ids = reply_index.get_ids(db, sn)[id - 1:id - 1 + count]
+    if not reply_ids:
+        return []
+    return db.query(Reply).filter(Reply.id.in_(reply_ids), Reply.status == "已通过").order_by(Reply.id).all()
 
 
-# 通过问题分页查回复（新）
 def get_reply_by_question(db: Session, id: int, sn: int):
-    return db.query(Reply).filter(Reply.question_id == sn, Reply.status == "已通过").offset(id - 1).first()
+    replies = get_replies_by_question(db, id, sn)
+    return replies[0] if replies else None
+
+
+# 一次联表查询问题及其第 id 条起的 count 条已通过回复，回复放在 question.replies 中，问题不存在时返回 None
+def get_question_with_replies(db: Session, sn: int, id: int, count: int = 1):
+    reply_ids = reply_index.get_ids(db, sn)[id - 1:id - 1 + count] if id >= 1 else []
+    rows = db.query(Question) \
+        .outerjoin(Reply, and_(Reply.question_id == Question.sn, Reply.id.in_(reply_ids), Reply.status == "已通过")) \
+        .options(contains_eager(Question.replies)).populate_existing() \
+        .filter(Question.sn == sn).order_by(Reply.id).all()
+    return rows[0] if rows else None
+
+
+# 一次联表查询回复及其所属问题
+def get_reply_with_question(db: Session, id: int):
+    return db.query(Reply).outerjoin(Reply.question).options(contains_eager(Reply.question)) \
+        .filter(Reply.id == id).first()
+
+
+# 按序号查询问题或回复对外展示的列，不存在时返回 None
+def get_question_row(db: Session, sn: int):
+    row = db.query(Question.sn, Question.question, Question.name, Question.status, Question.date) \
+        .filter(Question.sn == sn).first()
+    return dict(row._mapping) if row else None
+
+
+def get_reply_row(db: Session, id: int):
+    row = db.query(Reply.id, Reply.name, Reply.content, Reply.status, Reply.date, Reply.question_id) \
+        .filter(Reply.id == id).first()
+    return dict(row._mapping) if row else None
 
 
 # 根据序号查回复
@@ -238,73 +472,271 @@ def get_reply_by_id(db: Session, id: int, student_number: str):
     return reply
 
 
+# 关键词搜索已通过的问题和回复，按相关度排序分页，kind 为 None 时两类都搜
+def search_content(db: Session, keyword: str, kind: Optional[str], page: int, limit: int):
+    total, hits = search_backend.search(db, keyword, kind, page, limit)
+    question_sns = [doc_id for doc_kind, doc_id, _ in hits if doc_kind == "question"]
+    reply_ids = [doc_id for doc_kind, doc_id, _ in hits if doc_kind == "reply"]
+    rows = {}
+    if question_sns:
+        for row in db.query(Question.sn, Question.name, Question.question, Question.date) \
+                .filter(Question.sn.in_(question_sns), Question.status == "已通过"):
+            rows[("question", row.sn)] = dict(row._mapping)
+    if reply_ids:
+        for row in db.query(Reply.id, Reply.name, Reply.content, Reply.date, Reply.question_id) \
+                .filter(Reply.id.in_(reply_ids), Reply.status == "已通过"):
+            rows[("reply", row.id)] = dict(row._mapping)
+    items = [{"type": doc_kind, "score": score, "data": rows[(doc_kind, doc_id)]}
+             for doc_kind, doc_id, score in hits if (doc_kind, doc_id) in rows]
+    return total, items
+
+
 # 根据回复查问题
 def get_question_by_reply(db: Session, id: int, student_number: str):
-    reply = get_reply_by_id(db, id, student_number)
-    question_id = reply.question_id
-    if question_id:
-        question = db.query(Question).filter(Question.sn == question_id).first()
-        if not question:
-            question = {"name": "未知", "question": "原问题已被删除", "date": "未知"}
-        elif question.status != "已通过":
-            question = {"name": question.name, "question": "原问题审核尚未通过", "date": question.date}
-        else:
-            question = {"name": question.name, "question": question.question, "date": question.date}
+    reply = get_reply_with_question(db, id)
+    if not reply:
+        raise HTTPException(status_code=404, detail="此回复或已被删除")
+    question = reply.question
+    if not question:
+        data = ReplyQuestion(name="未知", question="原问题已被删除", date="未知")
+    elif question.status != "已通过":
+        data = ReplyQuestion(name=question.name, question="原问题审核尚未通过", date=question.date)
     else:
-        question = {"name": "未知", "question": "原问题已被删除", "date": "未知"}
-    return {"question": question, "reply": reply}
+        data = ReplyQuestion(name=question.name, question=question.question, date=question.date)
+    return ReplyQuestionResponse(question=data, reply=ReplyDetail.from_orm(reply),
+                                 total_num=question.approved_num if question and question.status == "已通过" else 0)
+
+
+# 回复状态对应的问题计数列
+def reply_counter(status: str):
+    if status == "已通过":
+        return Question.approved_num
+    if status == "待审批":
+        return Question.pending_num
+    return Question.rejected_num
+
+
+# 在当前事务中调整问题的回复计数，changes 为 [(问题序号, 回复状态, 增量)]。
+# 增量按计数列和问题汇总后以一条 UPDATE 完成，每列为 列 + CASE sn WHEN … THEN 增量 END
+def adjust_reply_counters(db: Session, changes):
+    deltas = {}
+    for question_sn, status, delta in changes:
+        if question_sn is None:
+            continue
+        column = deltas.setdefault(reply_counter(status).key, {})
+        column[question_sn] = column.get(question_sn, 0) + delta
+    values = {}
+    question_sns = set()
+    for column, by_question in deltas.items():
+        by_question = {question_sn: delta for question_sn, delta in by_question.items() if delta}
+        if by_question:
+            counter = getattr(Question, column)
+            values[counter] = counter + case(by_question, value=Question.sn, else_=0)
+            question_sns.update(by_question)
+    if values:
+        db.query(Question).filter(Question.sn.in_(sorted(question_sns))) \
+            .update(values, synchronize_session=False)
+
+
+# 按回复表重建所有问题的回复计数，以一条关联子查询 UPDATE 完成，返回更新的问题数
+def rebuild_reply_counters(db: Session):
+    counters = {}
+    for status in STATUS_CODES:
+        counters[reply_counter(status)] = select(func.count(Reply.id)) \
+            .where(Reply.question_id == Question.sn, Reply.status == status).scalar_subquery()
+    updated = db.query(Question).update(counters, synchronize_session=False)
+    db.commit()
+    return updated
 
 
-# 创建回复
-def create_question_reply(db: Session, reply: ReplyCreate, student_number: str):
-    question_id = reply.question_id
+# 校验回复的问题存在且已通过审核
+def check_reply_question(db: Session, question_id: int):
     question = get_sn_question(db, question_id)
     if not question:
         raise HTTPException(status_code=404, detail="不存在的问题")
     elif question.status != "已通过":
         raise HTTPException(status_code=400, detail="此问题审核尚未通过，暂无法回复")
+
+
+# 创建回复
+def create_question_reply(db: Session, reply: ReplyCreate, student_number: str):
+    question_id = reply.question_id
+    check_reply_question(db, question_id)
     db_item = models.Reply(**reply.dict(), source=student_number, status="待审批", date=date.today())
     db.add(db_item)
+    adjust_reply_counters(db, [(question_id, "待审批", 1)])
     db.commit()
     db.refresh(db_item)
     return db_item
 
 
-# 审核问题
-def examine_question(db: Session, question_sn: int, status: str):
-    question = db.query(Question).filter(Question.sn == question_sn).first()
+# 批量写入问题，rows 为包含 question、name、source、date 的字典列表，由调用方提交事务
+def bulk_create_questions(db: Session, rows):
+    if rows:
+        db.execute(insert(Question), [dict(row, status="待审批") for row in rows])
+
+
+# 批量写入回复，rows 为包含 name、content、question_id、source、date 的字典列表，由调用方提交事务
+def bulk_create_replies(db: Session, rows):
+    if rows:
+        db.execute(insert(Reply), [dict(row, status="待审批") for row in rows])
+        adjust_reply_counters(db, [(row["question_id"], "待审批", 1) for row in rows])
+
+
+# 审核问题，同时清除审核队列的租约；被其他管理员认领且租约未过期时拒绝
+def examine_question(db: Session, question_sn: int, status: str, moderator: Optional[str] = None):
+    question = db.query(Question).filter(Question.sn == question_sn).populate_existing().with_for_update().first()
     if not question:
         return False
+    if leased_by_other(question.claimed_by, question.lease_until, moderator):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="该内容已被其他管理员认领，请稍后再试")
     question.status = status
+    question.claimed_by, question.lease_until = None, None
+    content = question.question
     db.commit()
+    if status == "已通过":
+        question_pool.add(question_sn)
+        search_backend.add("question", question_sn, content)
+    else:
+        question_pool.discard(question_sn)
+        search_backend.remove("question", question_sn)
+    invalidate_responses([question_sn])
     return True
 
 
-# 审核回复
-def examine_reply(db: Session, reply_id: int, status: str):
-    reply = db.query(Reply).filter(Reply.id == reply_id).first()
+# 回复新通过审核后推送给提问者，approved 为 [(问题序号, 回复 id)]
+def notify_reply_approved(db: Session, approved):
+    if not approved:
+        return
+    owners = dict(db.query(Question.sn, Question.source)
+                  .filter(Question.sn.in_({question_id for question_id, _ in approved})).all())
+    # 审核结果已提交，推送失败（如 Redis 不可用）只记录日志，不影响审核接口
+    try:
+        for question_id, reply_id in approved:
+            if owners.get(question_id):
+                broker.publish(user_channel(owners[question_id]),
+                               {"type": "reply_approved", "question_sn": question_id, "reply_id": reply_id})
+    except Exception:
+        logger.exception("新回复推送失败")
+
+
+# 审核回复。旧状态在行锁下读取，两名管理员同时审核同一回复时后者等待前者提交，
+# 以提交后的状态计算计数增量，回复计数不会漂移
+def examine_reply(db: Session, reply_id: int, status: str, moderator: Optional[str] = None):
+    reply = db.query(Reply).filter(Reply.id == reply_id).populate_existing().with_for_update().first()
     if not reply:
         return False
+    if leased_by_other(reply.claimed_by, reply.lease_until, moderator):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="该内容已被其他管理员认领，请稍后再试")
+    newly_approved = status == "已通过" and reply.status != "已通过"
+    adjust_reply_counters(db, [(reply.question_id, reply.status, -1), (reply.question_id, status, 1)])
     reply.status = status
+    reply.claimed_by, reply.lease_until = None, None
+    question_id, content = reply.question_id, reply.content
     db.commit()
+    if status == "已通过":
+        reply_index.add(question_id, reply_id)
+        search_backend.add("reply", reply_id, content)
+    else:
+        reply_index.discard(question_id, reply_id)
+        search_backend.remove("reply", reply_id)
+    reply_index.broadcast([question_id])
+    invalidate_responses([question_id], [reply_id])
+    if newly_approved:
+        notify_reply_approved(db, [(question_id, reply_id)])
     return True
 
 
-# 查询问题数
+# 按目标状态分组，返回 {状态: [序号]}
+def group_by_status(items: dict):
+    groups = {}
+    for key, status in items.items():
+        groups.setdefault(status, []).append(key)
+    return groups
+
+
+# 批量审核问题，items 为 [(序号, 状态)]，同一序号以最后一次为准，
+# 返回 {序号: 是否审核成功}，不存在或被其他管理员认领的为 False
+def examine_questions(db: Session, items, moderator: Optional[str] = None):
+    wanted = dict(items)
+    now = datetime.utcnow()
+    questions = [(question_sn, content) for question_sn, content, claimed_by, lease_until in
+                 db.query(Question.sn, Question.question, Question.claimed_by, Question.lease_until)
+                 .filter(Question.sn.in_(list(wanted))).order_by(Question.sn).with_for_update()
+                 if not leased_by_other(claimed_by, lease_until, moderator, now)]
+    existing = {question_sn: wanted[question_sn] for question_sn, _ in questions}
+    for status, question_sns in group_by_status(existing).items():
+        db.query(Question).filter(Question.sn.in_(question_sns)) \
+            .update({Question.status: status, Question.claimed_by: None, Question.lease_until: None},
+                    synchronize_session=False)
+    db.commit()
+    for question_sn, content in questions:
+        if existing[question_sn] == "已通过":
+            question_pool.add(question_sn)
+            search_backend.add("question", question_sn, content)
+        else:
+            question_pool.discard(question_sn)
+            search_backend.remove("question", question_sn)
+    invalidate_responses(existing)
+    return {question_sn: question_sn in existing for question_sn in wanted}
+
+
+# 批量审核回复，items 为 [(回复 id, 状态)]，回复计数在同一事务中调整，
+# 返回 {回复 id: 是否审核成功}，不存在或被其他管理员认领的为 False。
+# 与 examine_reply 一样在行锁下读取旧状态，按 id 顺序加锁避免死锁
+def examine_replies(db: Session, items, moderator: Optional[str] = None):
+    wanted = dict(items)
+    now = datetime.utcnow()
+    replies = [(reply_id, question_id, old_status, content)
+               for reply_id, question_id, old_status, content, claimed_by, lease_until in
+               db.query(Reply.id, Reply.question_id, Reply.status, Reply.content, Reply.claimed_by,
+                        Reply.lease_until)
+               .filter(Reply.id.in_(list(wanted))).order_by(Reply.id).with_for_update()
+               if not leased_by_other(claimed_by, lease_until, moderator, now)]
+    changes = []
+    for reply_id, question_id, old_status, _ in replies:
+        changes.append((question_id, old_status, -1))
+        changes.append((question_id, wanted[reply_id], 1))
+    adjust_reply_counters(db, changes)
+    existing = {reply_id: wanted[reply_id] for reply_id, _, _, _ in replies}
+    for status, reply_ids in group_by_status(existing).items():
+        db.query(Reply).filter(Reply.id.in_(reply_ids)) \
+            .update({Reply.status: status, Reply.claimed_by: None, Reply.lease_until: None},
+                    synchronize_session=False)
+    db.commit()
+    for reply_id, question_id, _, content in replies:
+        if wanted[reply_id] == "已通过":
+            reply_index.add(question_id, reply_id)
+            search_backend.add("reply", reply_id, content)
+        else:
+            reply_index.discard(question_id, reply_id)
+            search_backend.remove("reply", reply_id)
+    reply_index.broadcast({question_id for _, question_id, _, _ in replies})
+    invalidate_responses({question_id for _, question_id, _, _ in replies}, existing)
+    notify_reply_approved(db, [(question_id, reply_id) for reply_id, question_id, old_status, _ in replies
+                               if wanted[reply_id] == "已通过" and old_status != "已通过"])
+    return {reply_id: reply_id in existing for reply_id in wanted}
+
+
+# 查询问题数，在主键索引上计数
 def get_question_num(db: Session):
-    return db.query(Question).count()
+    return db.query(func.count(Question.sn)).scalar()
 
 
 # 查询通过的回复数
 def get_accessible_reply_num(db: Session, sn: int):
-    return db.query(Reply).filter(Reply.question_id == sn, Reply.status == "已通过").count()
+    return len(reply_index.get_ids(db, sn))
 
 
-# 查询回复数
+# 查询回复数，返回（总数，待审批数）
 def get_reply_num(db: Session, sn: int):
-    total = db.query(Reply).filter(Reply.question_id == sn).count()
-    left = db.query(Reply).filter(Reply.question_id == sn, Reply.status == "待审批").count()
-    return total, left
+    counters = db.query(Question.approved_num, Question.pending_num, Question.rejected_num) \
+        .filter(Question.sn == sn).first()
+    if not counters:
+        return 0, 0
+    return sum(counters), counters.pending_num
 
 
 # 计算总页数
@@ -333,6 +765,13 @@ def delete_question(db: Session, question_sn: int, student_number: str):  # 删
         raise HTTPException(status_code=401, detail="权限不足，删除失败")
     db.delete(question)
     db.commit()
+    question_pool.discard(question_sn)
+    reply_index.invalidate(question_sn)
+    search_backend.remove("question", question_sn)
+    page_index.invalidate(QUESTION_PAGES)
+    invalidate_reply_pages([question_sn])
+    reply_index.broadcast([question_sn])
+    invalidate_responses([question_sn])
     return {"detail": "删除成功"}
 
 
@@ -343,4 +782,12 @@ def delete_question_by_manager(sn: list, db: Session):
     except IntegrityError:
         raise HTTPException(status_code=403, detail="请先删除该问题的回复")
     db.commit()
+    for question_sn in sn:
+        question_pool.discard(int(question_sn))
+        reply_index.invalidate(int(question_sn))
+        search_backend.remove("question", int(question_sn))
+    page_index.invalidate(QUESTION_PAGES)
+    invalidate_reply_pages([int(question_sn) for question_sn in sn])
+    reply_index.broadcast([int(question_sn) for question_sn in sn])
+    invalidate_responses([int(question_sn) for question_sn in sn])
     return question
@@ -0,0 +1,25 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from __strange_you_database__.database import DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+# 数据库线程池大小，默认与连接池上限一致，避免线程拿不到连接而空等
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+# 在数据库线程池中执行同步的 crud 调用，async 路由与依赖通过它访问数据库，避免阻塞事件循环
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # 带上当前上下文，保证 contextvars 在线程中依然可见
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(db_executor, call)
+
+
+def shutdown_db_executor():
+    db_executor.shutdown(wait=False)
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select
+
+from __strange_you_database__.database import ReadSessionLocal
+from __strange_you_database__.models import User, Question, Reply
+
+# 每批从服务端游标取出的行数，导出内存占用只与批大小有关
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# 可导出的表及其列；用户表不含 openid
+EXPORT_TABLES = {
+    "question": (Question, [Question.sn, Question.question, Question.source, Question.name, Question.status,
+                            Question.date, Question.approved_num, Question.pending_num, Question.rejected_num]),
+    "reply": (Reply, [Reply.id, Reply.question_id, Reply.name, Reply.content, Reply.source, Reply.status,
+                      Reply.date]),
+    "user": (User, [User.student_number, User.username]),
+}
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_statement(table: str, status: Optional[str] = None, start: Optional[date] = None,
+                     end: Optional[date] = None):
+    model, columns = EXPORT_TABLES[table]
+    statement = select(*columns).order_by(columns[0])
+    if status is not None:
+        statement = statement.where(model.status == status)
+    if start is not None:
+        statement = statement.where(model.date >= start)
+    if end is not None:
+        statement = statement.where(model.date <= end)
+    return statement
+
+
+# 以服务端游标分批读取，生成器自行管理会话，响应发送完毕或客户端断开时关闭
+def export_batches(statement):
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(statement.execution_options(stream_results=True))
+        for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield rows
+    finally:
+        db.close()
+
+
+# 以这些字符开头的单元格会被 Excel 等表格软件当作公式执行
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+# for_csv 为真时给可能被当作公式的文本加上 ' 前缀，防止用户提交的内容在导出表格中执行；jsonl 原样输出
+def _value(value, for_csv: bool = False):
+    if isinstance(value, date):
+        return value.isoformat()
+    if for_csv and isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+# 带 BOM 以便 Excel 正确识别中文
+def csv_stream(statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in statement.selected_columns])
+    yield ("\ufeff" + buffer.getvalue()).encode()
+    for rows in export_batches(statement):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([[_value(value, for_csv=True) for value in row] for row in rows])
+        yield buffer.getvalue().encode()
+
+
+def jsonl_stream(statement):
+    keys = [column.key for column in statement.selected_columns]
+    for rows in export_batches(statement):
+        yield "".join(json.dumps(dict(zip(keys, map(_value, row))), ensure_ascii=False) + "\n"
+                      for row in rows).encode()
+
+
+# 边生成边压缩为 gzip
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(table: str, format: str, status: Optional[str] = None, start: Optional[date] = None,
+                  end: Optional[date] = None, compress: bool = False):
+    statement = export_statement(table, status, start, end)
+    chunks = csv_stream(statement) if format == "csv" else jsonl_stream(statement)
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# 哈希进程数与允许排队的最大请求数，超出时直接拒绝，避免登录洪峰拖垮整个服务
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))
+
+_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# 以下两个函数在子进程中执行
+def _hash_password(password: str):
+    return _pwd_context.hash(password)
+
+
+def _verify_password(password: str, hashed_password: str):
+    return _pwd_context.verify(password, hashed_password)
+
+
+# 密码哈希服务：bcrypt 计算放到进程池中，事件循环只负责等待结果
+class PasswordHasher:
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self._executor = None
+
+    # 进程池在首次使用时创建，保证 gunicorn fork 出的每个 worker 各自持有。
+    # 此时数据库线程池、写入线程等已在运行，直接 fork 可能复制到被持有的锁而死锁，
+    # 因此子进程由 forkserver 启动，forkserver 只预加载本模块
+    def _get_executor(self):
+        if self._executor is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    async def _submit(self, func, *args):
+        # pending 只在事件循环线程中读写，无需加锁
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后再试")
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str):
+        return await self._submit(_hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str):
+        return await self._submit(_verify_password, password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": self.busy_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
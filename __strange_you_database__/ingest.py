@@ -0,0 +1,216 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError, DataError
+
+from __strange_you_database__ import crud
+from __strange_you_database__.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 异步写入开关、单批最大条数、刷新间隔（秒）与日志目录。
+# 开启后提交的问题和回复先写入本地追加日志并立即返回临时 id，由后台线程批量写入数据库
+INGEST_ENABLED = os.getenv("INGEST_MODE", "off") == "on"
+INGEST_FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "200"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1"))
+INGEST_JOURNAL_DIR = os.getenv("INGEST_JOURNAL_DIR", "ingest-journal")
+
+
+# 写入队列。每个 worker 持有一份加锁的日志文件，记录提交内容以及已入库的确认；
+# 启动时接管没有被其他进程锁住的日志（即崩溃或重启前遗留的），重放其中未确认的记录
+class IngestQueue:
+
+    def __init__(self, journal_dir: str = INGEST_JOURNAL_DIR, flush_size: int = INGEST_FLUSH_SIZE,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL):
+        self.journal_dir = journal_dir
+        # 死信日志放在子目录，不会被当作遗留日志重放
+        self.dead_letter_dir = os.path.join(journal_dir, "dead-letter")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.submitted = 0
+        self.flushed = 0
+        self.replayed = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self._pending = []
+        self._journal = None
+        self._thread = None
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+    def start(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        path = os.path.join(self.journal_dir, "%d-%s.jsonl" % (os.getpid(), uuid.uuid4().hex[:8]))
+        self._journal = open(path, "a+", encoding="utf-8")
+        fcntl.flock(self._journal, fcntl.LOCK_EX)
+        for orphan in glob.glob(os.path.join(self.journal_dir, "*.jsonl")):
+            if orphan != path:
+                self._replay(orphan)
+        self._thread = threading.Thread(target=self._run, name="ingest-flush", daemon=True)
+        self._thread.start()
+
+    # 接管遗留日志：文件已被其他进程接管删除、或拿不到锁（仍有进程在使用）时跳过
+    def _replay(self, path: str):
+        try:
+            journal = open(path, "r+", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with journal:
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            # 加锁前另一个进程可能已重放并删除该文件，此时打开的是已删除的旧文件
+            try:
+                if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                return
+            records = {}
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 写到一半的最后一行
+                    continue
+                if "ack" in entry:
+                    for record_id in entry["ack"]:
+                        records.pop(record_id, None)
+                else:
+                    records[entry["id"]] = entry
+            with self._lock:
+                for record in records.values():
+                    self._append(record)
+            os.unlink(path)
+        self.replayed += len(records)
+        logger.info("重放写入日志 %s，共 %d 条", path, len(records))
+
+    def _append(self, record):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._pending.append(record)
+
+    # 提交一条记录，写入日志后立即返回临时 id
+    def submit(self, kind: str, data: dict):
+        record = {"id": uuid.uuid4().hex, "kind": kind, "data": dict(data, date=date.today().isoformat())}
+        with self._lock:
+            self._append(record)
+            self.submitted += 1
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.notify()
+        return record["id"]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and len(self._pending) < self.flush_size:
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            try:
+                while self.flush() == self.flush_size:
+                    pass
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("批量写入失败，稍后重试")
+                time.sleep(self.flush_interval)
+            if stopping:
+                return
+
+    # 取出一批记录以多行 INSERT 写入数据库，成功后在日志中记录确认，返回处理条数。
+    # 整批因数据错误失败时逐条重试，仍失败的记录转入死信日志，不再阻塞后续提交；
+    # 连接中断等其他错误直接抛出，由 _run 稍后重试
+    def flush(self):
+        with self._lock:
+            batch = self._pending[:self.flush_size]
+        if not batch:
+            return 0
+        try:
+            self._insert(batch)
+        except (IntegrityError, DataError):
+            logger.warning("批量写入 %d 条失败，改为逐条写入", len(batch))
+            self._insert_each(batch)
+        else:
+            self._ack(batch)
+        return len(batch)
+
+    def _insert(self, records):
+        questions, replies = [], []
+        for record in records:
+            row = dict(record["data"], date=date.fromisoformat(record["data"]["date"]))
+            (questions if record["kind"] == "question" else replies).append(row)
+        db = SessionLocal()
+        try:
+            crud.bulk_create_questions(db, questions)
+            crud.bulk_create_replies(db, replies)
+            db.commit()
+        finally:
+            db.close()
+
+    # 逐条写入，已处理的记录（包括转入死信的）随时确认，中途抛出其他错误时不会重复写入
+    def _insert_each(self, records):
+        done, dead = [], []
+        try:
+            for record in records:
+                try:
+                    self._insert([record])
+                except (IntegrityError, DataError) as exc:
+                    logger.error("记录 %s 写入失败，转入死信日志: %s", record["id"], exc.orig)
+                    dead.append(dict(record, error=str(exc.orig)))
+                done.append(record)
+        finally:
+            self._ack(done, dead)
+
+    # 从待写入队列头部移除已处理的记录，并在日志中确认
+    def _ack(self, records, dead=()):
+        if not records:
+            return
+        with self._lock:
+            if dead:
+                os.makedirs(self.dead_letter_dir, exist_ok=True)
+                path = os.path.join(self.dead_letter_dir, "%d.jsonl" % os.getpid())
+                with open(path, "a", encoding="utf-8") as dead_letter:
+                    dead_letter.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in dead)
+                self.dead_lettered += len(dead)
+            del self._pending[:len(records)]
+            if self._pending:
+                self._journal.write(json.dumps({"ack": [record["id"] for record in records]}) + "\n")
+                self._journal.flush()
+            else:
+                # 全部入库后清空日志，避免无限增长
+                self._journal.truncate(0)
+            self.flushed += len(records) - len(dead)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join()
+        self._thread = None
+        # 正常退出且全部入库时删除日志，否则留给下次启动重放
+        if not self._pending:
+            os.unlink(self._journal.name)
+        self._journal.close()
+
+    def stats(self):
+        return {
+            "enabled": INGEST_ENABLED,
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "flushed": self.flushed,
+            "replayed": self.replayed,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+ingest_queue = IngestQueue()
@@ -1,9 +1,32 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Date
+from sqlalchemy import Column, ForeignKey, Integer, String, Date, DateTime, SmallInteger, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 
 from __strange_you_database__.database import Base
 
 
+# 审核状态在库中存为小整数，代码中仍使用中文状态字符串
+STATUS_CODES = {"待审批": 0, "已通过": 1, "未通过": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+class Status(TypeDecorator):
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value not in STATUS_CODES:
+            raise ValueError("未知的审核状态: %s" % value)
+        return STATUS_CODES[value]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return STATUS_NAMES[value]
+
+
 class User(Base):  # 用户表
     __tablename__ = "users"
     student_number = Column(String(12), primary_key=True, index=True)  # 学工号
@@ -26,10 +49,21 @@ class Question(Base):
     question = Column(String(200))
     source = Column(String(12), ForeignKey("users.student_number"), index=True)
     name = Column(String(10), default="匿名")
-    status = Column(String(8), default="待审批")
+    status = Column(Status, default="待审批", nullable=False)
     date = Column(Date)
+    # 各审核状态的回复数，随回复的创建、审核、删除同步维护
+    approved_num = Column(Integer, default=0, server_default="0", nullable=False)
+    pending_num = Column(Integer, default=0, server_default="0", nullable=False)
+    rejected_num = Column(Integer, default=0, server_default="0", nullable=False)
+    # 审核队列的认领人与租约到期时间（UTC），过期后重新回到队列
+    claimed_by = Column(String(12), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
     replies = relationship("Reply", back_populates="question")
 
+    __table_args__ = (
+        Index("ix_question_status_sn", "status", "sn"),
+    )
+
 
 class Reply(Base):
     __tablename__ = "reply"
@@ -37,7 +71,23 @@ class Reply(Base):
     name = Column(String(20))
     content = Column(String(1000))
     source = Column(String(12), ForeignKey("users.student_number"), index=True)
-    status = Column(String(8), default="待审批")
+    status = Column(Status, default="待审批", nullable=False)
     date = Column(Date)
     question_id = Column(Integer, ForeignKey("question.sn"))
+    claimed_by = Column(String(12), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
     question = relationship("Question", back_populates="replies")
+
+    __table_args__ = (
+        Index("ix_reply_question_status_id", "question_id", "status", "id"),
+        Index("ix_reply_question_date_id", "question_id", "date", "id"),
+        Index("ix_reply_status_id", "status", "id"),
+    )
+
+
+class TokenEpoch(Base):  # 令牌版本表，版本号递增后此前签发的令牌全部失效
+    __tablename__ = "token_epochs"
+    kind = Column(String(8), primary_key=True)  # user 或 manager
+    student_number = Column(String(12), primary_key=True)
+    epoch = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, index=True)  # UTC，用于增量刷新
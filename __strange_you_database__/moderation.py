@@ -0,0 +1,103 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from __strange_you_database__.models import Question, Reply
+
+# 认领租约时长（秒）与单次认领上限
+MODERATION_LEASE_SECONDS = int(os.getenv("MODERATION_LEASE_SECONDS", "300"))
+MODERATION_CLAIM_LIMIT = int(os.getenv("MODERATION_CLAIM_LIMIT", "50"))
+# 认领时与其他管理员冲突的最大重试次数
+MODERATION_CLAIM_ATTEMPTS = 3
+
+
+# 内容是否被其他管理员认领且租约未过期，此时只有认领人可以审核；moderator 为 None 时视为未认领任何内容
+def leased_by_other(claimed_by, lease_until, moderator, now: datetime = None):
+    if claimed_by is None or claimed_by == moderator or lease_until is None:
+        return False
+    return lease_until > (now or datetime.utcnow())
+
+
+# 审核队列：按主键从旧到新提供待审批内容，管理员认领一批后在租约期内独占，
+# 租约过期或主动释放后重新回到队列，审核后清除租约
+class ModerationQueue:
+
+    def __init__(self, model, key, lease_seconds: int = MODERATION_LEASE_SECONDS):
+        self.model = model
+        self.key = key
+        self.lease_seconds = lease_seconds
+        self.claims = 0
+        self.claimed = 0
+        self.conflicts = 0
+        self.released = 0
+        self._lock = threading.Lock()
+
+    def _claimable(self, now: datetime):
+        return [self.model.status == "待审批",
+                or_(self.model.lease_until.is_(None), self.model.lease_until < now)]
+
+    # 认领一批候选，返回 (候选数, 认领到的内容)。
+    # 候选由 (status, 主键) 索引上的一次查询取出，MySQL 下以 SKIP LOCKED 跳过其他事务正在认领的行；
+    # 条件 UPDATE 再次校验可认领，保证并发认领时同一条内容只会分给一个人
+    def _claim_batch(self, db: Session, moderator: str, limit: int, now: datetime, lease_until: datetime):
+        candidates = db.query(self.model).filter(*self._claimable(now)).order_by(self.key) \
+            .limit(limit).with_for_update(skip_locked=True).all()
+        keys = [getattr(item, self.key.key) for item in candidates]
+        if keys:
+            updated = db.query(self.model).filter(self.key.in_(keys), *self._claimable(now)) \
+                .update({self.model.claimed_by: moderator, self.model.lease_until: lease_until},
+                        synchronize_session="evaluate")
+            if updated != len(keys):
+                # 有候选被别人抢先认领，只保留自己这次认领到的
+                owned = {key for key, in db.query(self.key).filter(
+                    self.key.in_(keys), self.model.claimed_by == moderator, self.model.lease_until == lease_until)}
+                candidates = [item for item in candidates if getattr(item, self.key.key) in owned]
+            # 脱离会话，提交后不会因过期而逐条重新加载
+            for item in candidates:
+                db.expunge(item)
+        db.commit()
+        return len(keys), candidates
+
+    # 认领最早的 limit 条可认领内容，返回 (租约到期时间, 内容列表)；与他人冲突时再取下一批，最多重试几次
+    def claim(self, db: Session, moderator: str, limit: int):
+        # MySQL 的 DATETIME 不保存微秒
+        now = datetime.utcnow().replace(microsecond=0)
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        claimed = []
+        for _ in range(MODERATION_CLAIM_ATTEMPTS):
+            wanted = limit - len(claimed)
+            found, items = self._claim_batch(db, moderator, wanted, now, lease_until)
+            claimed.extend(items)
+            with self._lock:
+                self.conflicts += found - len(items)
+            if found == len(items) or len(claimed) == limit:
+                break
+        with self._lock:
+            self.claims += 1
+            self.claimed += len(claimed)
+        return lease_until, claimed
+
+    # 释放自己认领的内容，返回释放条数
+    def release(self, db: Session, moderator: str, keys: List[int]):
+        released = db.query(self.model).filter(self.key.in_(keys), self.model.claimed_by == moderator) \
+            .update({self.model.claimed_by: None, self.model.lease_until: None}, synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self.released += released
+        return released
+
+    def stats(self):
+        return {
+            "claims": self.claims,
+            "claimed": self.claimed,
+            "conflicts": self.conflicts,
+            "released": self.released,
+        }
+
+
+question_queue = ModerationQueue(Question, Question.sn)
+reply_queue = ModerationQueue(Reply, Reply.id)
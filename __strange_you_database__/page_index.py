@@ -0,0 +1,53 @@
+import threading
+
+from __strange_you_database__.cache import LRUCache
+
+# 最多缓存多少个列表的翻页键，以及键的有效期（秒）
+PAGE_INDEX_SIZE = 500
+PAGE_INDEX_TTL = 60
+# 跳过的行数少于该值时直接在覆盖索引上 OFFSET，更深的页才使用页边界缓存
+PAGE_INDEX_MIN_SKIP = 1000
+
+# 后台问题列表的键，回复列表的键为 (REPLY_PAGES, 问题序号)
+QUESTION_PAGES = "questions"
+REPLY_PAGES = "replies"
+
+
+# 后台列表深页的页边界。缓存列表全部行的排序键（由覆盖索引读出），按升序排列，
+# 深页直接取上一页最后一行的键作为游标走 keyset 查询，不再 OFFSET。
+# 新提交的内容排序键最大，只会追加在缓存末尾之后，已缓存的边界不受影响，因此只在删除后失效；
+# 同一列表同时只有一个请求构建，其他请求等它构建完成
+class PageIndex:
+
+    def __init__(self, maxsize: int = PAGE_INDEX_SIZE, ttl: float = PAGE_INDEX_TTL):
+        self.builds = 0
+        self._cache = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._building = {}
+
+    # load() 返回按升序排列的键序列，未缓存时调用
+    def keys(self, scope, load):
+        keys = self._cache.get(scope)
+        if keys is not None:
+            return keys
+        with self._lock:
+            building = self._building.setdefault(scope, threading.Lock())
+        with building:
+            keys = self._cache.peek(scope)
+            if keys is None:
+                keys = load()
+                self._cache.set(scope, keys)
+                self.builds += 1
+        with self._lock:
+            if self._building.get(scope) is building:
+                del self._building[scope]
+        return keys
+
+    def invalidate(self, scope):
+        self._cache.invalidate(scope)
+
+    def stats(self):
+        return dict(self._cache.stats(), builds=self.builds)
+
+
+page_index = PageIndex()
@@ -0,0 +1,56 @@
+import base64
+import json
+from datetime import date
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+# 把排序键编码为不透明的游标字符串
+def encode_cursor(*values):
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+# 解析游标，返回排序键列表；格式不对时返回 400
+def decode_cursor(cursor: str, size: int):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="分页游标无效")
+    return values
+
+
+def decode_date(value: str):
+    try:
+        return date.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+
+
+def _invalid_key(value):
+    # bool 是 int 的子类，也要排除
+    return not isinstance(value, int) or isinstance(value, bool)
+
+
+# 游标中的序号或 id，未传游标时返回 None
+def decode_key_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    key, = decode_cursor(cursor, 1)
+    if _invalid_key(key):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+    return key
+
+
+# 游标中的 (date, id)，未传游标时返回 None
+def decode_date_key_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    after_date, after_id = decode_cursor(cursor, 2)
+    if _invalid_key(after_id):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+    return decode_date(after_date), after_id
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 推送后端（memory 或 redis）与每个订阅者最多积压的消息数。
+# 多 worker 部署时审核请求与订阅连接可能不在同一进程，应使用 redis 后端
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "100"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_CHANNEL_PREFIX = "push:"
+
+
+def user_channel(student_number: str):
+    return "user:%s" % student_number
+
+
+# 单个订阅，消息放在所属事件循环的队列中
+class Subscription:
+
+    def __init__(self, broker, channel: str):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(PUBSUB_QUEUE_SIZE)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.broker.dropped += 1
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+# 进程内代理：publish 可在任意线程调用，消息经 call_soon_threadsafe 投递到订阅者的事件循环
+class MemoryBroker:
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel: str, message: dict):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+                self.delivered += 1
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            subscribers = sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+        return {
+            "backend": type(self).__name__,
+            "subscribers": subscribers,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+# Redis 代理：发布到 Redis，每个进程只开一个模式订阅连接，收到后转给本进程的订阅者
+class RedisBroker(MemoryBroker):
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis
+        super().__init__()
+        self.url = url
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, channel: str):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe(channel)
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._redis.publish(REDIS_CHANNEL_PREFIX + channel, json.dumps(message, ensure_ascii=False))
+
+    async def _listen(self):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(REDIS_CHANNEL_PREFIX + "*")
+            async for item in pubsub.listen():
+                if item["type"] != "pmessage":
+                    continue
+                channel = item["channel"].decode()[len(REDIS_CHANNEL_PREFIX):]
+                self.dispatch(channel, json.loads(item["data"]))
+        except Exception:
+            logger.exception("Redis 推送订阅中断，下一个订阅时重连")
+        finally:
+            await pubsub.close()
+            await client.close()
+
+
+broker = RedisBroker() if PUBSUB_BACKEND == "redis" else MemoryBroker()
@@ -0,0 +1,16 @@
+# 重建问题表中的回复计数：python -m __strange_you_database__.reconcile
+from __strange_you_database__.crud import rebuild_reply_counters
+from __strange_you_database__.database import SessionLocal
+
+
+def main():
+    db = SessionLocal()
+    try:
+        updated = rebuild_reply_counters(db)
+    finally:
+        db.close()
+    print("回复计数重建完成，共 %d 个问题" % updated)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import bisect
+import logging
+import threading
+import uuid
+
+from sqlalchemy.orm import Session
+
+from __strange_you_database__.cache import LRUCache
+from __strange_you_database__.database import primary_reads
+from __strange_you_database__.models import Reply
+from __strange_you_database__.pubsub import broker
+
+logger = logging.getLogger(__name__)
+
+# 最多缓存多少个问题的回复索引，以及索引的有效期（秒）
+REPLY_INDEX_SIZE = 2000
+REPLY_INDEX_TTL = 600
+# 各进程互相通知索引失效的推送频道
+REPLY_INDEX_CHANNEL = "reply-index"
+
+
+# 每个问题已通过回复的 id 有序列表，按位置取第 n 条回复和取总数都是 O(1)。
+# 写路径采用写时复制，读者拿到的列表不会被原地修改。
+# 本进程的改动直接更新索引，并经推送频道通知其他 worker 丢弃对应问题的索引，下次读取时从主库重建
+class ReplyIndex:
+
+    def __init__(self, maxsize: int = REPLY_INDEX_SIZE, ttl: float = REPLY_INDEX_TTL):
+        self.remote_invalidations = 0
+        self._origin = uuid.uuid4().hex
+        self._cache = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._subscription = None
+        self._listener = None
+
+    # 未缓存时从主库构建，副本的延迟不会被缓存下来
+    def get_ids(self, db: Session, question_sn: int):
+        ids = self._cache.get(question_sn)
+        if ids is None:
+            with primary_reads():
+                ids = [reply_id for reply_id, in db.query(Reply.id).filter(
+                    Reply.question_id == question_sn, Reply.status == "已通过").order_by(Reply.id)]
+            self._cache.set(question_sn, ids)
+        return ids
+
+    # 回复审核通过后加入索引，未缓存的问题等下次读取时再构建
+    def add(self, question_sn: int, reply_id: int):
+        with self._lock:
+            ids = self._cache.peek(question_sn)
+            if ids is None:
+                return
+            pos = bisect.bisect_left(ids, reply_id)
+            if pos < len(ids) and ids[pos] == reply_id:
+                return
+            self._cache.replace(question_sn, ids[:pos] + [reply_id] + ids[pos:])
+
+    def discard(self, question_sn: int, reply_id: int):
+        with self._lock:
+            ids = self._cache.peek(question_sn)
+            if ids is None:
+                return
+            pos = bisect.bisect_left(ids, reply_id)
+            if pos < len(ids) and ids[pos] == reply_id:
+                self._cache.replace(question_sn, ids[:pos] + ids[pos + 1:])
+
+    def invalidate(self, question_sn: int):
+        self._cache.invalidate(question_sn)
+
+    # 通知其他进程这些问题的已通过回复有变动，在提交之后调用
+    def broadcast(self, question_sns):
+        question_sns = sorted({question_sn for question_sn in question_sns if question_sn is not None})
+        if not question_sns:
+            return
+        try:
+            broker.publish(REPLY_INDEX_CHANNEL, {"origin": self._origin, "questions": question_sns})
+        except Exception:
+            logger.exception("回复索引失效通知发送失败")
+
+    # 在事件循环中订阅其他进程的失效通知
+    def start(self):
+        if self._listener is not None:
+            return
+        self._subscription = broker.subscribe(REPLY_INDEX_CHANNEL)
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            message = await self._subscription.get()
+            if message.get("origin") == self._origin:
+                continue
+            for question_sn in message["questions"]:
+                self.invalidate(question_sn)
+            self.remote_invalidations += 1
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        self._subscription.close()
+        self._listener = self._subscription = None
+
+    def stats(self):
+        return dict(self._cache.stats(), remote_invalidations=self.remote_invalidations)
+
+
+reply_index = ReplyIndex()
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+
+import orjson
+
+from fastapi.dependencies.utils import get_flat_dependant
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response
+
+from __strange_you_database__.cache import LRUCache
+from __strange_you_database__.database import primary_reads
+
+# 缓存后端（memory 或 redis）、有效期（秒）与进程内缓存容量。
+# 多 worker 部署时进程内缓存只能失效本进程的条目，应使用 redis 后端
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def question_tag(question_sn):
+    return "question:%s" % question_sn
+
+
+def reply_tag(reply_id):
+    return "reply:%s" % reply_id
+
+
+# 关键词搜索结果依赖所有已通过内容，任何审核或删除都会使其失效
+SEARCH_TAG = "search"
+
+
+# 进程内后端：条目存于 LRU 缓存，另记录标签到缓存键、缓存键到标签的映射；
+# 条目被淘汰或过期时一并移除其标签记录，映射大小不超过缓存容量
+class MemoryBackend:
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self._cache = LRUCache(maxsize, ttl, on_evict=self._forget)
+        self._tags = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, entry, tags):
+        self._cache.set(key, entry)
+        with self._lock:
+            self._untag(key)
+            self._keys[key] = tuple(tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def _untag(self, key):
+        for tag in self._keys.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _forget(self, key):
+        with self._lock:
+            self._untag(key)
+
+    def invalidate(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._untag(key)
+        for key in keys:
+            self._cache.invalidate(key)
+
+    def size(self):
+        return self._cache.stats()["size"]
+
+
+# Redis 后端：条目存为带过期时间的 hash，标签为记录缓存键的集合，多个 worker 共享
+class RedisBackend:
+
+    def __init__(self, url: str = REDIS_URL, ttl: int = RESPONSE_CACHE_TTL):
+        import redis
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        entry = self._redis.hmget("rc:" + key, "body", "etag")
+        if entry[0] is None:
+            return None
+        return entry[0], entry[1].decode()
+
+    def set(self, key, entry, tags):
+        body, etag = entry
+        pipe = self._redis.pipeline()
+        pipe.hset("rc:" + key, mapping={"body": body, "etag": etag})
+        pipe.expire("rc:" + key, self.ttl)
+        for tag in tags:
+            pipe.sadd("rc-tag:" + tag, key)
+            pipe.expire("rc-tag:" + tag, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, tags):
+        pipe = self._redis.pipeline()
+        for tag in tags:
+            pipe.smembers("rc-tag:" + tag)
+            pipe.delete("rc-tag:" + tag)
+        results = pipe.execute()
+        keys = set()
+        for members in results[::2]:
+            keys |= members
+        if keys:
+            self._redis.delete(*["rc:" + key.decode() for key in keys])
+
+    def size(self):
+        return None
+
+
+# 路由声明的查询参数名（含依赖项中的），按路由缓存
+_declared_params = {}
+
+
+def declared_query_params(route):
+    if route is None:
+        return frozenset()
+    names = _declared_params.get(route.unique_id)
+    if names is None:
+        names = _declared_params[route.unique_id] = frozenset(
+            param.alias for param in get_flat_dependant(route.dependant).query_params)
+    return names
+
+
+# 响应缓存：按路由与查询参数缓存序列化后的 JSON，并以 ETag 支持 304
+class ResponseCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    # 缓存键只包含路由声明的查询参数，附加的无关参数不会产生新的缓存条目
+    @staticmethod
+    def key(request: Request):
+        names = declared_query_params(request.scope.get("route"))
+        params = "&".join("%s=%s" % item for item in sorted(request.query_params.multi_items())
+                          if item[0] in names)
+        return request.url.path + "?" + params
+
+    # build 返回响应内容，tags 为标签列表或根据内容计算标签的函数；build 抛出的异常不会被缓存
+    def respond(self, request: Request, build, tags):
+        key = self.key(request)
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            # 未命中通常发生在写入使其失效之后，从主库构建以免缓存副本上的旧数据
+            with primary_reads():
+                content = build()
+            # 字典、列表、日期等由 orjson 直接序列化，其余对象（ORM、pydantic）再交给 jsonable_encoder
+            body = orjson.dumps(content, default=jsonable_encoder)
+            entry = (body, '"%s"' % hashlib.md5(body).hexdigest())
+            self.backend.set(key, entry, tags(content) if callable(tags) else tags)
+        else:
+            self.hits += 1
+        body, etag = entry
+        if request.headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    def invalidate(self, *tags):
+        if tags:
+            self.backend.invalidate(tags)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+response_cache = ResponseCache(RedisBackend() if RESPONSE_CACHE_BACKEND == "redis" else MemoryBackend())
@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from __strange_you_database__.database import SessionLocal
+from __strange_you_database__.models import TokenEpoch
+
+logger = logging.getLogger(__name__)
+
+# 令牌版本的增量刷新间隔（秒），其他进程撤销的令牌最迟在一个间隔后失效；
+# 增量刷新时回看的时长（秒），容忍各进程的时钟偏差与同一秒内的写入
+TOKEN_EPOCH_REFRESH_INTERVAL = float(os.getenv("TOKEN_EPOCH_REFRESH_INTERVAL", "5"))
+TOKEN_EPOCH_LOOKBACK = float(os.getenv("TOKEN_EPOCH_LOOKBACK", "60"))
+
+# 令牌类型，写入令牌的 kind 声明，防止前台令牌被当作后台令牌使用
+USER_TOKEN = "user"
+MANAGER_TOKEN = "manager"
+
+
+# 令牌版本表在内存中的副本。签发令牌时写入当前版本号，校验时只比较签名与版本号，不查询数据库；
+# 注销、修改密码、删除用户时版本号加一，此前签发的令牌全部失效。
+# 没有记录的主体版本号为 0，表中只有撤销过令牌的主体，后台线程按 updated_at 增量同步
+class EpochStore:
+
+    def __init__(self, refresh_interval: float = TOKEN_EPOCH_REFRESH_INTERVAL,
+                 lookback: float = TOKEN_EPOCH_LOOKBACK):
+        self.refresh_interval = refresh_interval
+        self.lookback = lookback
+        self.loaded = False
+        self.checks = 0
+        self.rejected = 0
+        self.bumps = 0
+        self.loads = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self._epochs = {}
+        self._since = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def current(self, kind: str, student_number: str):
+        return self._epochs.get((kind, student_number), 0)
+
+    # 版本号低于当前版本的令牌已被撤销
+    def check(self, kind: str, student_number: str, epoch: int):
+        self.checks += 1
+        if not isinstance(epoch, int) or epoch < self.current(kind, student_number):
+            self.rejected += 1
+            return False
+        return True
+
+    # 令牌的版本号高于本进程已知的版本：其他进程刚撤销旧令牌并签发了新令牌，
+    # 本进程尚未刷新到，校验前应先用 load 从主库重新加载该主体
+    def ahead(self, kind: str, student_number: str, epoch: int):
+        return isinstance(epoch, int) and epoch > self.current(kind, student_number)
+
+    # 合并版本号，只升不降，本进程递增的版本与增量刷新的结果先后到达都不会回退
+    def apply(self, epochs: dict):
+        with self._lock:
+            for key, epoch in epochs.items():
+                if epoch > self._epochs.get(key, 0):
+                    self._epochs[key] = epoch
+
+    # 从主库同步自上次刷新以来变化的版本号，首次调用时全量加载
+    def refresh(self, db: Session = None):
+        session = db or SessionLocal()
+        try:
+            query = session.query(TokenEpoch.kind, TokenEpoch.student_number, TokenEpoch.epoch,
+                                  TokenEpoch.updated_at)
+            if self._since is not None:
+                query = query.filter(TokenEpoch.updated_at >= self._since - timedelta(seconds=self.lookback))
+            rows = query.all()
+        finally:
+            if db is None:
+                session.close()
+        self.apply({(kind, student_number): epoch for kind, student_number, epoch, _ in rows})
+        if rows:
+            latest = max(updated_at for _, _, _, updated_at in rows)
+            if self._since is None or latest > self._since:
+                self._since = latest
+        self.loaded = True
+        self.refreshes += 1
+        self._refreshed_at = time.monotonic()
+        return len(rows)
+
+    # 签发令牌前从主库读取最新版本号，避免刚在其他进程注销后签发出立即失效的令牌
+    def load(self, db: Session, kind: str, student_number: str):
+        self.loads += 1
+        epoch = db.query(TokenEpoch.epoch).filter(TokenEpoch.kind == kind,
+                                                  TokenEpoch.student_number == student_number).scalar() or 0
+        self.apply({(kind, student_number): epoch})
+        return self.current(kind, student_number)
+
+    # 在调用方的事务中把版本号加一并返回新版本号，调用方提交后再 apply 到内存。
+    # 以一条 upsert 完成插入或加一，并发的首次撤销不会因主键冲突失败
+    def bump(self, db: Session, kind: str, student_numbers: List[str]):
+        student_numbers = list(dict.fromkeys(student_numbers))
+        if not student_numbers:
+            return {}
+        # MySQL 的 DATETIME 不保存微秒
+        now = datetime.utcnow().replace(microsecond=0)
+        rows = [{"kind": kind, "student_number": student_number, "epoch": 1, "updated_at": now}
+                for student_number in student_numbers]
+        bumped = {"epoch": TokenEpoch.epoch + 1, "updated_at": now}
+        if db.get_bind().dialect.name == "mysql":
+            upsert = mysql.insert(TokenEpoch).on_duplicate_key_update(bumped)
+        else:
+            upsert = sqlite.insert(TokenEpoch).on_conflict_do_update(
+                index_elements=[TokenEpoch.kind, TokenEpoch.student_number], set_=bumped)
+        db.execute(upsert, rows)
+        epochs = db.query(TokenEpoch.student_number, TokenEpoch.epoch) \
+            .filter(TokenEpoch.kind == kind, TokenEpoch.student_number.in_(student_numbers))
+        self.bumps += len(student_numbers)
+        return {(kind, student_number): epoch for student_number, epoch in epochs}
+
+    # 撤销主体已签发的全部令牌
+    def revoke(self, db: Session, kind: str, student_number: str):
+        epochs = self.bump(db, kind, [student_number])
+        db.commit()
+        self.apply(epochs)
+        return epochs[(kind, student_number)]
+
+    # 先同步加载一次，保证开始处理请求时已知全部撤销记录
+    def start(self):
+        self.refresh()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="token-epoch-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                self.failed_refreshes += 1
+                logger.exception("令牌版本刷新失败")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        return {
+            "principals": len(self._epochs),
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "bumps": self.bumps,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "refresh_age": time.monotonic() - self._refreshed_at if self._refreshed_at is not None else None,
+        }
+
+
+token_epochs = EpochStore()
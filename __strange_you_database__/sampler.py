@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from __strange_you_database__.database import SessionLocal, primary_reads
+from __strange_you_database__.models import Question
+
+logger = logging.getLogger(__name__)
+
+# 弹幕墙每次返回的问题数
+SCREEN_BATCH_SIZE = 11
+# 问题池整体重建间隔（秒），用于兜底多进程部署下其他 worker 的修改
+POOL_REFRESH_SECONDS = 300
+
+
+# 已通过问题的序号池。
+# 序号保存在列表中，另用字典记录每个序号的位置，增删都是交换到末尾再弹出，均为 O(1)。
+# 抽取采用增量 Fisher-Yates：游标之前是本轮已发出的序号，每次只在游标之后随机挑一个换到游标处，
+# 因此单次抽取代价只与批量大小有关，且一轮之内不会重复发放同一问题。
+# 定期重建由后台线程完成，请求路径上只在首次使用或线程未启动时加载，且同时只有一个请求加载
+class QuestionPool:
+
+    def __init__(self, refresh_seconds: int = POOL_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.loads = 0
+        self.failed_loads = 0
+        self._sns = []
+        self._positions = {}
+        self._cursor = 0
+        self._loaded_at = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _swap(self, i: int, j: int):
+        if i == j:
+            return
+        sns = self._sns
+        sns[i], sns[j] = sns[j], sns[i]
+        self._positions[sns[i]] = i
+        self._positions[sns[j]] = j
+
+    def _expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    # 从主库重建问题池，只读取主键列；读取期间的增删先记下，换入新池前重放，不会丢失
+    def load(self, db: Session):
+        with self._load_lock:
+            self._load(db)
+
+    def _load(self, db: Session):
+        with self._lock:
+            self._pending = []
+        try:
+            with primary_reads():
+                sns = [sn for sn, in db.query(Question.sn).filter(Question.status == "已通过")]
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        random.shuffle(sns)
+        with self._lock:
+            self._sns = sns
+            self._positions = {sn: i for i, sn in enumerate(sns)}
+            self._cursor = 0
+            self._loaded_at = time.monotonic()
+            for added, sn in self._pending:
+                if added:
+                    self._add(sn)
+                else:
+                    self._discard(sn)
+            self._pending = None
+        self.loads += 1
+
+    # 已有问题池时过期只由一个请求重建，其余请求继续使用旧池；尚未加载时其余请求等待加载完成
+    def ensure_loaded(self, db: Session):
+        if not self._expired():
+            return
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._expired():
+                self._load(db)
+        finally:
+            self._load_lock.release()
+
+    # 启动后台线程，每 refresh_seconds 秒重建一次
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="question-pool-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            db = SessionLocal()
+            try:
+                self.load(db)
+            except Exception:
+                self.failed_loads += 1
+                logger.exception("问题池重建失败")
+            finally:
+                db.close()
+            if self._stopping.wait(self.refresh_seconds):
+                return
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join()
+        self._thread = None
+
+    # 问题审核通过后加入问题池
+    def add(self, sn: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((True, sn))
+            self._add(sn)
+
+    def _add(self, sn: int):
+        if self._loaded_at is None or sn in self._positions:
+            return
+        self._positions[sn] = len(self._sns)
+        self._sns.append(sn)
+
+    # 问题被删除或不再通过时移出问题池
+    def discard(self, sn: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((False, sn))
+            self._discard(sn)
+
+    def _discard(self, sn: int):
+        pos = self._positions.get(sn)
+        if pos is None:
+            return
+        if pos < self._cursor:
+            # 已发放区间内的元素先换到已发放区间末尾，保持游标两侧的划分
+            self._cursor -= 1
+            self._swap(pos, self._cursor)
+            pos = self._cursor
+        self._swap(pos, len(self._sns) - 1)
+        self._sns.pop()
+        del self._positions[sn]
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self):
+        return {"size": len(self._sns), "loads": self.loads, "failed_loads": self.failed_loads}
+
+    # 随机抽取 k 个互不相同的问题序号
+    def sample(self, k: int = SCREEN_BATCH_SIZE):
+        with self._lock:
+            sns = self._sns
+            n = len(sns)
+            if n <= k:
+                batch = list(sns)
+                random.shuffle(batch)
+                return batch
+            batch = []
+            chosen = set()
+            while len(batch) < k:
+                if self._cursor >= n:
+                    self._cursor = 0
+                j = random.randint(self._cursor, n - 1)
+                self._swap(self._cursor, j)
+                sn = sns[self._cursor]
+                self._cursor += 1
+                # 换轮时可能抽到本批已有的序号，跳过即可
+                if sn not in chosen:
+                    chosen.add(sn)
+                    batch.append(sn)
+            return batch
+
+    def __len__(self):
+        return len(self._sns)
+
+
+question_pool = QuestionPool()
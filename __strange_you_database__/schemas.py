@@ -1,8 +1,10 @@
 from datetime import date
-from typing import Union, Optional
+from typing import Union, Optional, List
 
 from fastapi import Form
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
+
+from __strange_you_database__.models import STATUS_CODES
 
 
 class UserSchema(BaseModel):
@@ -129,10 +131,25 @@ class ManagerMessage(BaseModel):
         orm_mode = True
 
 
+# 前台当前登录用户
+class UserMessage(BaseModel):
+    student_number: str
+    username: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
 # 审核问题
 class QuestionExamine(BaseModel):
     sn: int
-    status: str
+    status: str = Field(..., example="已通过")
+
+    @validator("status")
+    def check_status(cls, value):
+        if value not in STATUS_CODES:
+            raise ValueError("审核状态只能是：" + "、".join(STATUS_CODES))
+        return value
 
 
 # 回复模型
@@ -154,6 +171,12 @@ class ReplyQuery(ReplyCreate):
     id: int
 
 
+# 分页查询自己的问题，latest_reply_id 为最新一条已通过回复的 id
+class OwnQuestionQuery(QuestionQuery):
+    latest_reply_id: Optional[int] = None
+    has_new_reply: bool = False
+
+
 class OwnReplyQuery(BaseModel):
     id: int
     name: Optional[str] = "匿名"
@@ -163,6 +186,28 @@ class OwnReplyQuery(BaseModel):
         orm_mode = True
 
 
+class OwnQuestionPageData(BaseModel):
+    questions: List[OwnQuestionQuery]
+    next_cursor: Optional[str] = None
+
+
+class OwnQuestionPage(BaseModel):
+    message: str
+    detail: str
+    data: OwnQuestionPageData
+
+
+class OwnReplyPageData(BaseModel):
+    replies: List[OwnReplyQuery]
+    next_cursor: Optional[str] = None
+
+
+class OwnReplyPage(BaseModel):
+    message: str
+    detail: str
+    data: OwnReplyPageData
+
+
 # 通过回复查问题-响应体
 class QuestionResponse(BaseModel):
     sn: int
@@ -173,3 +218,52 @@ class QuestionResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+# 回复详情页使用的精简模型，不含学号等字段
+class ReplyDetail(BaseModel):
+    id: int
+    name: Optional[str] = "匿名"
+    content: Optional[str] = None
+    date: date
+    question_id: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+
+class QuestionDetail(BaseModel):
+    sn: int
+    name: Optional[str] = "匿名"
+    question: str
+    date: date
+
+    class Config:
+        orm_mode = True
+
+
+# 通过问题分页查回复
+class QuestionRepliesData(BaseModel):
+    total_num: int
+    reply: ReplyDetail
+    question: QuestionDetail
+    next_replies: Optional[List[ReplyDetail]] = None
+
+
+class QuestionRepliesResponse(BaseModel):
+    message: str
+    detail: str
+    data: QuestionRepliesData
+
+
+# 通过回复查问题，原问题被删除或未通过审核时以占位内容代替，date 为“未知”
+class ReplyQuestion(BaseModel):
+    name: Optional[str] = "匿名"
+    question: str
+    date: Union[date, str]
+
+
+class ReplyQuestionResponse(BaseModel):
+    question: ReplyQuestion
+    reply: ReplyDetail
+    total_num: int
@@ -0,0 +1,300 @@
+import abc
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from __strange_you_database__.database import SessionLocal
+from __strange_you_database__.models import Question, Reply, STATUS_CODES
+
+logger = logging.getLogger(__name__)
+
+# 搜索后端：local 为进程内倒排索引，mysql 使用 FULLTEXT ngram 索引
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "local")
+# 本地索引整体重建间隔（秒）
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "300"))
+
+# 连续的中日韩字符切成二元组，字母数字按词切分
+_TOKEN_PATTERN = re.compile(r"[㐀-鿿豈-﫿]+|[0-9a-zA-Z]+")
+_CJK_PATTERN = re.compile(r"[㐀-鿿豈-﫿]")
+
+
+def tokenize(content: str):
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(content or ""):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+class SearchBackend(abc.ABC):
+
+    def add(self, kind: str, doc_id: int, content: str):
+        pass
+
+    def remove(self, kind: str, doc_id: int):
+        pass
+
+    # 返回 (命中总数, [(类型, id, 得分)])，kind 为 None 时同时搜索问题和回复
+    @abc.abstractmethod
+    def search(self, db: Session, keyword: str, kind, page: int, limit: int):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {"backend": type(self).__name__}
+
+
+# 一份倒排索引。单个中日韩字符的查询词命中所有包含该字符的二元组，
+# _chars 记录字符到这些词元的映射。
+# 换入使用后（shared 为 True）倒排表写时复制，查询在锁外打分时持有的倒排表不会再被修改；
+# 重建中的索引只有重建线程可见，原地修改
+class _InvertedIndex:
+
+    def __init__(self):
+        self.postings = {}
+        self.docs = {}
+        self.chars = {}
+        self.shared = False
+
+    def add(self, key, content):
+        self.remove(key)
+        counts = {}
+        for token in tokenize(content):
+            counts[token] = counts.get(token, 0) + 1
+        if not counts:
+            return
+        self.docs[key] = tuple(counts)
+        for token, tf in counts.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = {}
+                if _CJK_PATTERN.match(token):
+                    for char in set(token):
+                        self.chars.setdefault(char, set()).add(token)
+            elif self.shared:
+                posting = dict(posting)
+            posting[key] = tf
+            self.postings[token] = posting
+
+    def remove(self, key):
+        for token in self.docs.pop(key, ()):
+            posting = self.postings.get(token)
+            if posting is None or key not in posting:
+                continue
+            if len(posting) > 1:
+                if self.shared:
+                    posting = dict(posting)
+                del posting[key]
+                self.postings[token] = posting
+                continue
+            del self.postings[token]
+            for char in set(token):
+                tokens = self.chars.get(char)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.chars[char]
+
+    # 查询词对应的倒排表引用，须在锁内调用；单个中日韩字符对应包含它的所有二元组的倒排表
+    def lookup(self, token):
+        if len(token) == 1 and _CJK_PATTERN.match(token):
+            return [self.postings[gram] for gram in self.chars.get(token, ())]
+        posting = self.postings.get(token)
+        return [posting] if posting else []
+
+
+# 合并同一查询词的多个倒排表，词频相加
+def _merge_postings(postings):
+    if len(postings) == 1:
+        return postings[0]
+    merged = {}
+    for posting in postings:
+        for key, tf in posting.items():
+            merged[key] = merged.get(key, 0) + tf
+    return merged
+
+
+# 进程内倒排索引，只收录已通过的问题和回复。
+# 后台线程在启动时和之后每隔 SEARCH_INDEX_REFRESH_SECONDS 秒在锁外重建一份新索引再整体替换，
+# 兜底多进程部署下其他 worker 的修改；两次重建之间由 crud 的审核、删除操作增量维护。
+# 重建期间的增量修改同时记入 _pending，替换前重放到新索引上。索引尚未建好时按 LIKE 查询数据库
+class LocalSearchIndex(SearchBackend):
+
+    _COLUMNS = {
+        "question": (Question.sn, Question.question),
+        "reply": (Reply.id, Reply.content),
+    }
+
+    def __init__(self, refresh_seconds: float = SEARCH_INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.rebuilds = 0
+        self.failed_rebuilds = 0
+        self._index = None
+        self._pending = None
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        index = _InvertedIndex()
+        try:
+            db = SessionLocal()
+            try:
+                questions = db.query(Question.sn, Question.question).filter(Question.status == "已通过")
+                for sn, content in questions.yield_per(1000):
+                    index.add(("question", sn), content)
+                replies = db.query(Reply.id, Reply.content).filter(Reply.status == "已通过")
+                for reply_id, content in replies.yield_per(1000):
+                    index.add(("reply", reply_id), content)
+            finally:
+                db.close()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for key, content in self._pending:
+                if content is None:
+                    index.remove(key)
+                else:
+                    index.add(key, content)
+            index.shared = True
+            self._index = index
+            self._pending = None
+        self.rebuilds += 1
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="search-index-rebuild", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.rebuild()
+            except Exception:
+                self.failed_rebuilds += 1
+                logger.exception("搜索索引重建失败")
+            if self._stopping.wait(self.refresh_seconds):
+                return
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join()
+        self._thread = None
+
+    def _apply(self, key, content):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((key, content))
+            if self._index is not None:
+                if content is None:
+                    self._index.remove(key)
+                else:
+                    self._index.add(key, content)
+
+    def add(self, kind: str, doc_id: int, content: str):
+        self._apply((kind, doc_id), content)
+
+    def remove(self, kind: str, doc_id: int):
+        self._apply((kind, doc_id), None)
+
+    def search(self, db: Session, keyword: str, kind, page: int, limit: int):
+        tokens = set(tokenize(keyword))
+        if not tokens:
+            return 0, []
+        # 锁内只取倒排表的引用，求交集和打分在锁外进行，不阻塞审核写入和其他查询
+        with self._lock:
+            index = self._index
+            if index is None:
+                self.start()
+            else:
+                lookups = [index.lookup(token) for token in tokens]
+                total_docs = len(index.docs)
+        if index is None:
+            return self._scan(db, keyword, kind, page, limit)
+        postings = [_merge_postings(lookup) for lookup in lookups if lookup]
+        if len(postings) < len(lookups):
+            return 0, []
+        # 从最短的倒排表开始求交集，要求命中所有词元
+        postings.sort(key=len)
+        candidates = [key for key in postings[0] if kind is None or key[0] == kind]
+        for posting in postings[1:]:
+            candidates = [key for key in candidates if key in posting]
+        weights = [math.log(1 + total_docs / len(posting)) for posting in postings]
+        scored = ((sum(posting[key] * weight for posting, weight in zip(postings, weights)), key)
+                  for key in candidates)
+        top = heapq.nlargest(page * limit, scored)
+        return len(candidates), [(key[0], key[1], score) for score, key in top[(page - 1) * limit:]]
+
+    # 索引建好之前的兜底：按 LIKE 匹配整个关键词，新内容在前，得分均为 0
+    def _scan(self, db: Session, keyword: str, kind, page: int, limit: int):
+        total = 0
+        hits = []
+        for name in [kind] if kind else ["question", "reply"]:
+            key, column = self._COLUMNS[name]
+            condition = [key.class_.status == "已通过", column.contains(keyword, autoescape=True)]
+            total += db.query(func.count(key)).filter(*condition).scalar()
+            hits.extend((name, doc_id, 0.0) for doc_id, in
+                        db.query(key).filter(*condition).order_by(key.desc()).limit(page * limit))
+        return total, hits[(page - 1) * limit:page * limit]
+
+    def stats(self):
+        index = self._index
+        return {"backend": type(self).__name__,
+                "documents": len(index.docs) if index else 0,
+                "tokens": len(index.postings) if index else 0,
+                "rebuilds": self.rebuilds,
+                "failed_rebuilds": self.failed_rebuilds}
+
+
+# MySQL FULLTEXT ngram 索引（见迁移 0004），索引由数据库自行维护
+class MySQLFulltextSearch(SearchBackend):
+
+    _TABLES = {
+        "question": ("question", "sn", "question"),
+        "reply": ("reply", "id", "content"),
+    }
+
+    def search(self, db: Session, keyword: str, kind, page: int, limit: int):
+        kinds = [kind] if kind else ["question", "reply"]
+        total = 0
+        hits = []
+        for name in kinds:
+            table, key, column = self._TABLES[name]
+            match = "MATCH(%s) AGAINST (:keyword IN NATURAL LANGUAGE MODE)" % column
+            condition = "WHERE status = :status AND %s" % match
+            params = {"keyword": keyword, "status": STATUS_CODES["已通过"]}
+            total += db.execute(text("SELECT COUNT(*) FROM %s %s" % (table, condition)), params).scalar()
+            rows = db.execute(text("SELECT %s, %s AS score FROM %s %s ORDER BY score DESC LIMIT :n" % (
+                key, match, table, condition)), dict(params, n=page * limit))
+            hits.extend((name, doc_id, score) for doc_id, score in rows)
+        hits.sort(key=lambda hit: hit[2], reverse=True)
+        return total, hits[(page - 1) * limit:page * limit]
+
+
+search_backend = MySQLFulltextSearch() if SEARCH_BACKEND == "mysql" else LocalSearchIndex()
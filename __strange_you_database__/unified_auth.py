@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from __strange_you_database__.cache import LRUCache
+from __strange_you_database__.utils import get_info_plus
+
+# 同时向统一认证发起的请求数、单次认证超时（秒）以及认证结果缓存时间（秒）
+AUTH_CONCURRENCY = int(os.getenv("AUTH_CONCURRENCY", "8"))
+AUTH_TIMEOUT = float(os.getenv("AUTH_TIMEOUT", "10"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "5000"))
+
+
+# 统一认证客户端：在独立线程池中调用 get_info_plus，用信号量限制并发（含超时后仍在运行的调用）、超时后快速失败，
+# 并短时缓存认证成功的结果，避免同一学生反复登录时重复请求统一认证
+class UnifiedAuthClient:
+
+    def __init__(self, concurrency: int = AUTH_CONCURRENCY, timeout: float = AUTH_TIMEOUT):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.timeouts = 0
+        self.failures = 0
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="unified-auth")
+        self._cache = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+        # 缓存键中的密码摘要加盐，进程重启后失效
+        self._salt = secrets.token_bytes(16)
+
+    def _cache_key(self, username: str, password: str):
+        digest = hashlib.sha256(self._salt + username.encode() + b"\0" + password.encode()).hexdigest()
+        return username, digest
+
+    # 校验学号密码并返回 {"student_number": ..., "name": ...}
+    async def verify(self, username: str, password: str):
+        key = self._cache_key(username, password)
+        user_info = self._cache.get(key)
+        if user_info is not None:
+            return user_info
+        # 等待名额与等待认证结果共用一个超时
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="统一认证超时，请稍后再试")
+        future = loop.run_in_executor(self._executor, get_info_plus, username, password)
+        self.in_flight += 1
+        # 名额在工作线程真正结束时才归还：超时只是不再等待，线程仍在请求统一认证
+        future.add_done_callback(self._release)
+        try:
+            user_info = await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="统一认证超时，请稍后再试")
+        except Exception:
+            self.failures += 1
+            raise
+        self._cache.set(key, user_info)
+        return user_info
+
+    def _release(self, future):
+        self.in_flight -= 1
+        self._semaphore.release()
+        # 超时后无人等待的结果，取出异常以免事件循环报告未处理
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self):
+        return dict(self._cache.stats(), concurrency=self.concurrency, in_flight=self.in_flight,
+                    timeouts=self.timeouts, failures=self.failures)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+unified_auth = UnifiedAuthClient()
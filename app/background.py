@@ -3,10 +3,27 @@ from datetime import timedelta
 from fastapi.security import OAuth2PasswordRequestForm
 
 from __strange_you_database__ import crud
-from fastapi import Depends, HTTPException, Form
+from fastapi import Depends, HTTPException, Form, Query
 from requests import Session
-from __strange_you_database__.database import SessionLocal
+from __strange_you_database__.database import SessionLocal, pool_stats
+from __strange_you_database__.cache import user_cache, manager_cache
+from __strange_you_database__.executor import run_db
+from __strange_you_database__.hasher import password_hasher
+from __strange_you_database__.reply_index import reply_index
+from __strange_you_database__.page_index import page_index
+from __strange_you_database__.sampler import question_pool
+from __strange_you_database__.search import search_backend
+from __strange_you_database__.unified_auth import unified_auth
+from __strange_you_database__.response_cache import response_cache
+from __strange_you_database__.ingest import ingest_queue
+from __strange_you_database__.pagination import encode_cursor, decode_key_cursor, decode_date_key_cursor
+from __strange_you_database__.export import EXPORT_TABLES, EXPORT_FORMATS, export_stream
+from __strange_you_database__.moderation import question_queue, reply_queue, MODERATION_CLAIM_LIMIT
+from __strange_you_database__.pubsub import broker
+from __strange_you_database__.revocation import token_epochs, MANAGER_TOKEN
 from fastapi import APIRouter
+from starlette.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
 
 from __strange_you_database__.utils import *
 from __strange_you_database__.schemas import *
@@ -16,6 +33,7 @@ background = APIRouter(
     prefix="/background",
     tags=["background"],
     responses={404: {"description": "Not found"}},
+    default_response_class=ORJSONResponse,
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/background/token")
@@ -36,45 +54,76 @@ async def get_current_manager(token: str = Depends(oauth2_scheme), db: Session =
         token_data = TokenData(student_number=student_number)
     except JWTError:
         raise credentials_exception
-    manager = get_manager(db, student_number=student_number)
-    if manager is None:
+    if not token_epochs.loaded:
+        await run_db(token_epochs.refresh)
+    # 带类型与版本号的令牌只校验签名与版本号，除刚在其他进程签发的新令牌外不查询数据库
+    if "kind" in payload:
+        if payload["kind"] != MANAGER_TOKEN:
+            raise credentials_exception
+        # 其他进程刚签发的新令牌，本进程的版本号尚未刷新到，先从主库重新加载
+        if token_epochs.ahead(MANAGER_TOKEN, student_number, payload.get("ep")):
+            await run_db(token_epochs.load, db, MANAGER_TOKEN, student_number)
+        if not token_epochs.check(MANAGER_TOKEN, student_number, payload.get("ep")):
+            raise credentials_exception
+        return ManagerMessage(student_number=student_number)
+    # 旧令牌没有版本号，视为版本 0，仍需确认管理员存在
+    if not token_epochs.check(MANAGER_TOKEN, student_number, 0):
         raise credentials_exception
+    manager = manager_cache.get(student_number)
+    if manager is None:
+        db_manager = await run_db(get_manager, db, student_number=student_number)
+        if db_manager is None:
+            raise credentials_exception
+        manager = ManagerMessage.from_orm(db_manager)
+        manager_cache.set(student_number, manager)
+    return manager
+
+
+# 签发带类型与版本号的后台令牌
+def manager_token(student_number: str, epoch: int):
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        data={"sub": student_number, "kind": MANAGER_TOKEN, "ep": epoch}, expires_delta=access_token_expires
+    )
+
+
+# 校验管理员账号密码，bcrypt 校验交给哈希进程池
+async def authenticate(student_number: str, password: str, db: Session):
+    manager = await run_db(get_manager, db, student_number)
+    if not manager:
+        return False
+    if not await password_hasher.verify(password, manager.hashed_password):
+        return False
     return manager
 
 
 @background.post("/token", status_code=200, response_model=Token, response_description="login successfully",
                  summary="交互文档登录")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    manager = authenticate_manager(form_data.username, form_data.password, db)
+    manager = await authenticate(form_data.username, form_data.password, db)
     if not manager:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": manager.student_number}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    epoch = await run_db(token_epochs.load, db, MANAGER_TOKEN, manager.student_number)
+    return {"access_token": manager_token(manager.student_number, epoch), "token_type": "bearer"}
 
 
 # 登录
 @background.post("/managers/login", status_code=200, response_model=Token, response_description="login successfully",
                  summary="登录")
 async def login_for_access_token(form_data: PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    manager = authenticate_manager(form_data.username, form_data.password, db)
+    manager = await authenticate(form_data.username, form_data.password, db)
     if not manager:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": manager.student_number}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    epoch = await run_db(token_epochs.load, db, MANAGER_TOKEN, manager.student_number)
+    return {"access_token": manager_token(manager.student_number, epoch), "token_type": "bearer"}
 
 
 # 添加管理员
@@ -83,10 +132,10 @@ async def signup(
         student_number: str = Form(..., max_length=12),
         password: str = Form(..., min_length=8, max_lengh=20),
         db=Depends(get_db)):
-    if get_manager(db, student_number):
+    if await run_db(get_manager, db, student_number):
         raise HTTPException(detail="用户名已存在", status_code=400)
-    hashed_password = hash_password(password)
-    add_manager(db, student_number, "管理员", hashed_password)
+    hashed_password = await password_hasher.hash(password)
+    await run_db(add_manager, db, student_number, "管理员", hashed_password)
     return {"message": "success", "detail": "注册成功", "data": {}}
 
 
@@ -96,9 +145,65 @@ async def signup(
                  summary="修改密码")
 async def change_password(password: str = Form(..., min_length=8, max_lengh=20), db: Session = Depends(get_db),
                           current_manager: ManagerMessage = Depends(get_current_manager)):
-    hashed_password = hash_password(password)
-    change_manager_password(db, current_manager.student_number, hashed_password)
-    return {"message": "success", "detail": "修改成功", "data": {}}
+    hashed_password = await password_hasher.hash(password)
+    epoch = await run_db(change_manager_password, db, current_manager.student_number, hashed_password)
+    # 旧令牌已失效，返回新令牌以免当前会话被登出
+    return {"message": "success", "detail": "修改成功",
+            "data": {"access_token": manager_token(current_manager.student_number, epoch), "token_type": "bearer"}}
+
+
+# 管理员退出登录，此前签发的全部令牌随之失效
+@background.post("/managers/logout", status_code=200, summary="退出登录")
+async def logout(db: Session = Depends(get_db), current_manager: ManagerMessage = Depends(get_current_manager)):
+    await run_db(token_epochs.revoke, db, MANAGER_TOKEN, current_manager.student_number)
+    manager_cache.invalidate(current_manager.student_number)
+    return {"message": "success", "detail": "已退出登录", "data": {}}
+
+
+# 汇总各组件的运行状态
+def collect_stats():
+    return {"user_cache": user_cache.stats(),
+            "manager_cache": manager_cache.stats(),
+            "password_hasher": password_hasher.stats(),
+            "reply_index": reply_index.stats(),
+            "page_index": page_index.stats(),
+            "search": search_backend.stats(),
+            "question_pool": question_pool.stats(),
+            "unified_auth": unified_auth.stats(),
+            "response_cache": response_cache.stats(),
+            "ingest": ingest_queue.stats(),
+            "moderation": {"question": question_queue.stats(), "reply": reply_queue.stats()},
+            "push": broker.stats(),
+            "token_epochs": token_epochs.stats(),
+            "db_pool": pool_stats()}
+
+
+# 运行状态统计
+@background.get("/stats", summary="运行状态统计")
+def read_stats(current_manager: ManagerMessage = Depends(get_current_manager)):
+    return collect_stats()
+
+
+# 流式导出问题、回复或用户，可按审核状态与日期筛选，gzip 为 true 时边导出边压缩
+@background.get("/export/{table}", summary="导出数据")
+def export(table: str, format: str = "csv", status: Optional[str] = None,
+           start: Optional[date] = None, end: Optional[date] = None, gzip: bool = False,
+           current_manager: ManagerMessage = Depends(get_current_manager)):
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="不支持导出该表")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="导出格式只能是：" + "、".join(EXPORT_FORMATS))
+    if table == "user" and (status is not None or start is not None or end is not None):
+        raise HTTPException(status_code=400, detail="用户表不支持按状态或日期筛选")
+    if status is not None and status not in STATUS_CODES:
+        raise HTTPException(status_code=400, detail="审核状态只能是：" + "、".join(STATUS_CODES))
+    filename = "%s-%s.%s" % (table, date.today().strftime("%Y%m%d"), format)
+    media_type = EXPORT_FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(export_stream(table, format, status, start, end, gzip), media_type=media_type,
+                             headers={"Content-Disposition": 'attachment; filename="%s"' % filename})
 
 
 # 创建用户
@@ -156,29 +261,26 @@ def update_user(
     return crud.updateUser(user_student_number=user_student_number, user_name=user_name, db=db)
 
 
-# 分页查询问题
+# 分页查询问题，传入 cursor 时按游标翻页，否则按页码
 @background.get("/questions", summary="分页查询问题")
-def get_questions(page: int = 1, limit: int = 10, db: Session = Depends(get_db),
+def get_questions(page: int = 1, limit: int = 10, cursor: Optional[str] = None, db: Session = Depends(get_db),
                   current_manager: ManagerMessage = Depends(get_current_manager)
                   ):
-    questions = crud.get_questions(db, page=page, limit=limit)
-    question_num = get_question_num(db)
-    total_page = get_total_page(question_num, limit)
-    if not questions:
-        if page == 1:
-            raise HTTPException(status_code=404, detail="获取失败，无更多信息")
-        if page > total_page:
-            page = total_page
-            questions = crud.get_questions(db, page=page, limit=limit)
-            if not questions:
-                raise HTTPException(status_code=404, detail="获取失败，无更多信息")
-    return {"message": "success", "detail": "获取成功",
-            "data": {"question_information": questions,
-                     "page_information": {
-                         "page": page,
-                         "total_page": total_page,
-                         "num": len(questions),
-                     }}}
+    if cursor is not None:
+        questions = crud.get_questions_after(db, decode_key_cursor(cursor), limit)
+        page_information = {"num": len(questions)}
+    else:
+        question_num = get_question_num(db)
+        total_page = get_total_page(question_num, limit)
+        page = max(1, min(page, total_page))
+        questions = crud.get_questions(db, page=page, limit=limit)
+        page_information = {"page": page, "total_page": total_page, "num": len(questions)}
+    if not questions and (cursor is not None or page == 1):
+        raise HTTPException(status_code=404, detail="获取失败，无更多信息")
+    page_information["next_cursor"] = encode_cursor(questions[-1]["sn"]) if len(questions) == limit else None
+    return ORJSONResponse({"message": "success", "detail": "获取成功",
+                           "data": {"question_information": questions,
+                                    "page_information": page_information}})
 
 
 # 通过序号查询问题
@@ -233,37 +335,80 @@ def examine_question(
         db: Session = Depends(get_db),
         current_manager: ManagerMessage = Depends(get_current_manager)
 ):
-    result = crud.examine_question(db, question.sn, question.status)
+    result = crud.examine_question(db, question.sn, question.status, current_manager.student_number)
     if not result:
         raise HTTPException(status_code=404, detail="此问题不存在")
     return {"message": "Success"}
 
 
-# 查询问题的回复
+# 批量审核问题
+@background.put("/questions", summary="批量审核问题")
+def examine_questions(
+        questions: List[QuestionExamine],
+        db: Session = Depends(get_db),
+        current_manager: ManagerMessage = Depends(get_current_manager)
+):
+    results = crud.examine_questions(db, [(question.sn, question.status) for question in questions],
+                                     current_manager.student_number)
+    return {"message": "Success", "detail": "审核完毕",
+            "data": [{"sn": sn, "success": success} for sn, success in results.items()]}
+
+
+# 审核队列：认领最早的一批待审批内容，租约期内不会分给其他管理员
+MODERATION_QUEUES = {"questions": question_queue, "replies": reply_queue}
+
+
+def get_moderation_queue(kind: str):
+    if kind not in MODERATION_QUEUES:
+        raise HTTPException(status_code=404, detail="不存在的审核队列")
+    return MODERATION_QUEUES[kind]
+
+
+@background.post("/queue/{kind}/claim", summary="认领待审批的问题或回复")
+def claim_moderation(kind: str, limit: int = Query(10, ge=1, le=MODERATION_CLAIM_LIMIT),
+                     db: Session = Depends(get_db),
+                     current_manager: ManagerMessage = Depends(get_current_manager)):
+    queue = get_moderation_queue(kind)
+    lease_until, items = queue.claim(db, current_manager.student_number, limit)
+    return {"message": "Success", "detail": "认领成功" if items else "暂无待审批内容",
+            "data": {"lease_until": lease_until, "items": items}}
+
+
+# 释放自己认领但暂不审核的内容，使其立即回到队列
+@background.post("/queue/{kind}/release", summary="释放认领的问题或回复")
+def release_moderation(kind: str, keys: List[int],
+                       db: Session = Depends(get_db),
+                       current_manager: ManagerMessage = Depends(get_current_manager)):
+    queue = get_moderation_queue(kind)
+    released = queue.release(db, current_manager.student_number, keys)
+    return {"message": "Success", "detail": "释放成功", "data": {"released": released}}
+
+
+# 查询问题的回复，传入 cursor 时按游标翻页，否则按页码
 @background.get("/replies", summary="查询问题的回复")
-def get_replies(question_sn: int, page: int = 1, limit: int = 10, db: Session = Depends(get_db),
+def get_replies(question_sn: int, page: int = 1, limit: int = 10, cursor: Optional[str] = None,
+                db: Session = Depends(get_db),
                 current_manager: ManagerMessage = Depends(get_current_manager)
                 ):
-    reply = get_reply(db, question_sn=question_sn, page=page, limit=limit)
     num = get_reply_num(db, question_sn)
-    total_page = get_total_page(num[0], limit)
-    if not reply:
-        if page == 1:
-            raise HTTPException(status_code=404, detail="获取失败，无更多信息")
-        if page > total_page:
-            page = total_page
-            reply = crud.get_reply(db, question_sn=question_sn, page=page, limit=limit)
-            if not reply:
-                raise HTTPException(status_code=404, detail="获取失败，无更多信息")
-    return {"message": "success", "detail": "获取成功",
-            "data": {
-                "question_sn": question_sn,
-                "reply_information": reply,
-                "unexamined_replies": num[1],
-                "page_information": {"page": page,
-                                     "total_page": total_page,
-                                     "num": len(reply)
-                                     }}}
+    if cursor is not None:
+        reply = crud.get_reply_after(db, question_sn, decode_date_key_cursor(cursor), limit)
+        page_information = {"num": len(reply)}
+    else:
+        total_page = get_total_page(num[0], limit)
+        page = max(1, min(page, total_page))
+        reply = get_reply(db, question_sn=question_sn, page=page, limit=limit)
+        page_information = {"page": page, "total_page": total_page, "num": len(reply)}
+    if not reply and (cursor is not None or page == 1):
+        raise HTTPException(status_code=404, detail="获取失败，无更多信息")
+    page_information["next_cursor"] = encode_cursor(reply[-1]["date"], reply[-1]["id"]) if len(reply) == limit \
+        else None
+    return ORJSONResponse({"message": "success", "detail": "获取成功",
+                           "data": {
+                               "question_sn": question_sn,
+                               "reply_information": reply,
+                               "unexamined_replies": num[1],
+                               "page_information": page_information}})
 
 
 # 删除回复
@@ -286,10 +431,23 @@ def examine_question(
         db: Session = Depends(get_db),
         current_manager: ManagerMessage = Depends(get_current_manager)
 ):
-    result = crud.examine_reply(db, reply.sn, reply.status)
+    result = crud.examine_reply(db, reply.sn, reply.status, current_manager.student_number)
     if not result:
         raise HTTPException(status_code=404, detail="此回复不存在")
     return {"message": "Success", "detail": "审核完毕"}
+
+
+# 批量审核回复
+@background.put("/replies", summary="批量审核回复")
+def examine_replies(
+        replies: List[QuestionExamine],
+        db: Session = Depends(get_db),
+        current_manager: ManagerMessage = Depends(get_current_manager)
+):
+    results = crud.examine_replies(db, [(reply.sn, reply.status) for reply in replies],
+                                   current_manager.student_number)
+    return {"message": "Success", "detail": "审核完毕",
+            "data": [{"sn": reply_id, "success": success} for reply_id, success in results.items()]}
 # @router.get("/Replies")  # 查询所有回复
 # def get_replies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
 #     replies = crud.get_replies(db, skip=skip, limit=limit)
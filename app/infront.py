@@ -1,7 +1,9 @@
+import asyncio
+import json
 from datetime import date
 from typing import Optional, List
 
-from fastapi import FastAPI, HTTPException, APIRouter, Depends
+from fastapi import FastAPI, HTTPException, APIRouter, Depends, Query
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
 from passlib.context import CryptContext
@@ -10,16 +12,30 @@ from starlette import status
 from __strange_you_database__ import crud
 from __strange_you_database__ import models
 from __strange_you_database__ import schemas
+from __strange_you_database__.cache import user_cache
+from __strange_you_database__.executor import run_db
+from __strange_you_database__.unified_auth import unified_auth
+from __strange_you_database__.ingest import ingest_queue, INGEST_ENABLED
+from __strange_you_database__.response_cache import response_cache, question_tag, reply_tag, SEARCH_TAG
+from __strange_you_database__.pagination import encode_cursor, decode_key_cursor
+from __strange_you_database__.pubsub import broker, user_channel
+from __strange_you_database__.revocation import token_epochs, USER_TOKEN
+from starlette.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
+from starlette.requests import Request
 from __strange_you_database__.database import SessionLocal, engine
 from __strange_you_database__.utils import *
 from __strange_you_database__.schemas import *
 from __strange_you_database__.crud import *
 
 app = FastAPI
+# 默认以 orjson 序列化响应；列表接口的数据已是字典，直接返回 ORJSONResponse，
+# 跳过 response_model 校验与 jsonable_encoder，response_model 仅用于生成文档
 infront = APIRouter(
     prefix="/infront",
     tags=["infront"],
     responses={404: {"description": "Not found"}},
+    default_response_class=ORJSONResponse,
 )
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -59,54 +75,81 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         student_number: str = payload.get("sub")
         if student_number is None:
             raise credentials_exception
-        token_data = TokenData(student_number=student_number)
+        token_data = TokenData(student_number=student_number, name=payload.get("name"))
     except JWTError:
         raise credentials_exception
-    user = get_user(db, student_number)
-    if user is None:
+    if not token_epochs.loaded:
+        await run_db(token_epochs.refresh)
+    # 带类型与版本号的令牌只校验签名与版本号，除刚在其他进程签发的新令牌外不查询数据库
+    if "kind" in payload:
+        if payload["kind"] != USER_TOKEN:
+            raise credentials_exception
+        # 其他进程刚签发的新令牌，本进程的版本号尚未刷新到，先从主库重新加载
+        if token_epochs.ahead(USER_TOKEN, student_number, payload.get("ep")):
+            await run_db(token_epochs.load, db, USER_TOKEN, student_number)
+        if not token_epochs.check(USER_TOKEN, student_number, payload.get("ep")):
+            raise credentials_exception
+        return UserMessage(student_number=student_number, username=token_data.name)
+    # 旧令牌没有版本号，视为版本 0，仍需确认用户存在
+    if not token_epochs.check(USER_TOKEN, student_number, 0):
         raise credentials_exception
+    user = user_cache.get(student_number)
+    if user is None:
+        db_user = await run_db(get_user, db, student_number)
+        if db_user is None:
+            raise credentials_exception
+        user = UserMessage.from_orm(db_user)
+        user_cache.set(student_number, user)
     return user
 
 
+# 签发前台令牌，带用户名、令牌类型与版本号，前台token有效期为30天
+def user_token(student_number: str, name: str, epoch: int):
+    access_token_expires = timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
+    return create_access_token(
+        data={"sub": student_number, "name": name, "kind": USER_TOKEN, "ep": epoch}, expires_delta=access_token_expires
+    )
+
+
 @infront.post("/token", status_code=200, response_model=Token, response_description="login successfully",
               summary="交互文档登录")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     # 统一认证获取用户信息
-    user_info = get_info_plus(form_data.username, form_data.password)
+    user_info = await unified_auth.verify(form_data.username, form_data.password)
     # 先根据学号在数据库中查找用户
-    user = get_user(db, form_data.username)
+    user = await run_db(get_user, db, form_data.username)
     # 添加到数据库里
     if not user:
         student_number = user_info["student_number"]
         name = user_info["name"]
-        create_user(db, student_number, name)
-    # 前台token有效期为30天
-    access_token_expires = timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
-    access_token = create_access_token(
-        data={"sub": user.student_number}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+        user = await run_db(create_user, db, student_number, name)
+    epoch = await run_db(token_epochs.load, db, USER_TOKEN, user.student_number)
+    return {"access_token": user_token(user.student_number, user.username, epoch), "token_type": "bearer"}
 
 
 # 登录注册接口
 @infront.post("/login", summary="登录注册")
-def login(user: schemas.LoginModel, db: Session = Depends(get_db)):
+async def login(user: schemas.LoginModel, db: Session = Depends(get_db)):
     # 统一认证获取用户信息
-    user_info = get_info_plus(user.username, user.password)
+    user_info = await unified_auth.verify(user.username, user.password)
     # 先根据学号在数据库中查找用户
-    user_old = get_user(db, user.username)
+    user_old = await run_db(get_user, db, user.username)
     # 添加到数据库里
     if not user_old:
         student_number = user_info["student_number"]
         name = user_info["name"]
-        create_user(db, student_number, name)
-    # 前台token有效期为30天
-    access_token_expires = timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
+        user_old = await run_db(create_user, db, student_number, name)
+    epoch = await run_db(token_epochs.load, db, USER_TOKEN, user.username)
     # 根据学号发放token（虽然写作username）
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": user_token(user.username, user_old.username, epoch), "token_type": "bearer"}
+
+
+# 退出登录，该用户此前签发的全部令牌随之失效
+@infront.post("/logout", summary="退出登录")
+async def logout(db: Session = Depends(get_db), current_user: UserMessage = Depends(get_current_user)):
+    await run_db(token_epochs.revoke, db, USER_TOKEN, current_user.student_number)
+    user_cache.invalidate(current_user.student_number)
+    return {"message": "success", "detail": "已退出登录", "data": {}}
 
 
 # 创建问题
@@ -115,6 +158,11 @@ def create_question(question: schemas.QuestionCreate,
                     current_user=Depends(get_current_user),
                     db: Session = Depends(get_db)):
     student_number = current_user.student_number
+    # 开启异步写入时先落日志，返回临时 id
+    if INGEST_ENABLED:
+        provisional_id = ingest_queue.submit(
+            "question", {"question": question.question, "name": question.name, "source": student_number})
+        return {"message": "Success", "provisional_id": provisional_id}
     db_question = crud.create_question(db=db, question=question.question, source=student_number, name=question.name)
     return db_question
 
@@ -127,19 +175,90 @@ def read_questions(
 ):
     source = current_user.student_number
     questions = get_ones_questions(db, source)
-    return questions
+    return ORJSONResponse(questions)
+
+
+# 分页查询自己的问题。since 为客户端已看过的最大回复 id，
+# 有比它更新的已通过回复时 has_new_reply 为 true
+@infront.get("/my-questions", response_model=OwnQuestionPage, summary="分页查询自己的问题")
+def read_my_questions(
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        since: int = Query(0, ge=0),
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_user),
+):
+    questions = get_ones_questions_after(db, current_user.student_number, decode_key_cursor(cursor), limit)
+    latest = get_latest_reply_ids(db, [question["sn"] for question in questions])
+    for question in questions:
+        question["latest_reply_id"] = latest.get(question["sn"])
+        question["has_new_reply"] = latest.get(question["sn"], 0) > since
+    return ORJSONResponse({"message": "Success", "detail": "查询成功",
+                           "data": {"questions": questions,
+                                    "next_cursor": encode_cursor(questions[-1]["sn"]) if len(questions) == limit
+                                    else None}})
+
+
+# 分页查询自己的回复
+@infront.get("/my-replies", response_model=OwnReplyPage, summary="分页查询自己的回复")
+def read_my_replies(
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_user),
+):
+    replies = get_ones_replies_after(db, current_user.student_number, decode_key_cursor(cursor), limit)
+    return ORJSONResponse({"message": "Success", "detail": "查询成功",
+                           "data": {"replies": replies,
+                                    "next_cursor": encode_cursor(replies[-1]["id"]) if len(replies) == limit
+                                    else None}})
+
+
+# 推送连接的心跳间隔（秒），避免代理因空闲断开
+PUSH_HEARTBEAT_SECONDS = 25
+
+
+# 长连接接口的认证：不使用请求级会话，认证用的会话在返回前关闭，不会在整个推送期间占用连接池
+async def get_stream_user(token: str = Depends(oauth2_scheme)):
+    db = SessionLocal()
+    try:
+        return await get_current_user(token, db)
+    finally:
+        db.close()
+
+
+# 以 Server-Sent Events 推送自己问题下新通过审核的回复，取代反复轮询
+@infront.get("/events", summary="订阅新回复通知")
+async def events(current_user=Depends(get_stream_user)):
+    subscription = broker.subscribe(user_channel(current_user.student_number))
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), PUSH_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield "event: %s\ndata: %s\n\n" % (message["type"], json.dumps(message, ensure_ascii=False))
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # 弹幕墙上的问题
 @infront.get("/bullet-screen", response_model=List[QuestionScreen], summary="弹幕墙上的问题")
 def bullet_screen(
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
         current_user=Depends(get_current_user),
 ):
     questions = get_screen_questions(db)
     if not questions:
         raise HTTPException(status_code=404, detail="暂无可回复的问题")
-    return questions
+    return ORJSONResponse(questions)
 
 
 # 删除问题
@@ -158,6 +277,10 @@ def create_reply(
         current_user=Depends(get_current_user),
         db: Session = Depends(get_db)):
     student_number = current_user.student_number
+    if INGEST_ENABLED:
+        check_reply_question(db, reply.question_id)
+        provisional_id = ingest_queue.submit("reply", dict(reply.dict(), source=student_number))
+        return {"message": "Success", "provisional_id": provisional_id}
     create_question_reply(db, reply, student_number)
     return {"message": "Success"}
 
@@ -172,16 +295,20 @@ def read_replies(
     replies = get_ones_replies(db, source)
     if not replies:
         raise HTTPException(status_code=404, detail="当前未有回复")
-    return replies
+    return ORJSONResponse(replies)
 
 
-# 通过回复查问题
-@infront.get("/reply-question", summary="通过回复查问题")
+# 通过回复查问题，一并返回原问题的可见回复数
+@infront.get("/reply-question", response_model=ReplyQuestionResponse, summary="通过回复查问题")
 def read_reply(id: int,
+               request: Request,
                current_user=Depends(get_current_user),
-               db: Session = Depends(get_db)):
-    question = get_question_by_reply(db, id, current_user.student_number)
-    return question
+               db: Session = Depends(get_read_db)):
+    def build():
+        return get_question_by_reply(db, id, current_user.student_number).dict()
+
+    return response_cache.respond(request, build,
+                                  lambda content: [reply_tag(id), question_tag(content["reply"]["question_id"])])
 
 
 # 通过问题查回复(筛选、搜索使用)
@@ -189,7 +316,7 @@ def read_reply(id: int,
 def read_replies_by_question(
         sn: int,
         current_user=Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     student_number = current_user.student_number
     question = get_sn(db, sn)
@@ -219,56 +346,80 @@ def reply_delete(reply_id: int,
     return crud.delete_reply(reply_id, current_user.student_number, db)
 
 
-# 通过问题分页查回复（新）
-@infront.get("/question/{sn}", summary="通过问题分页查回复")
+# 通过问题分页查回复（新），prefetch 大于 0 时一并返回其后的若干条回复
+@infront.get("/question/{sn}", response_model=QuestionRepliesResponse, response_model_exclude_unset=True,
+             summary="通过问题分页查回复")
 def get_reply_(
         sn: int,
+        request: Request,
         id: int = 1,
+        prefetch: int = Query(0, ge=0, le=20),
         current_user=Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
-    question = get_sn_question(db, sn)
-    if not question:
-        raise HTTPException(status_code=404, detail="此问题不存在")
-    if question.status != "已通过":
-        raise HTTPException(status_code=400, detail="审核未通过，暂无法回复")
-    num = get_accessible_reply_num(db, sn)
-    reply = get_reply_by_question(db,  id, sn)
-    if not reply:
-        raise HTTPException(status_code=404, detail="此回复不存在")
-    reply.source = ""
-    question.source = ""
-    return {
-        "message": "Success",
-        "detail": "查询成功",
-        "data": {
-            "total_num": num,
-            "reply": reply,
-            "question": question
-        }
-    }
+    def build():
+        question = get_question_with_replies(db, sn, id, prefetch + 1)
+        if not question:
+            raise HTTPException(status_code=404, detail="此问题不存在")
+        if question.status != "已通过":
+            raise HTTPException(status_code=400, detail="审核未通过，暂无法回复")
+        replies = [ReplyDetail.from_orm(reply) for reply in question.replies]
+        if not replies:
+            raise HTTPException(status_code=404, detail="此回复不存在")
+        data = QuestionRepliesData(total_num=question.approved_num, reply=replies[0],
+                                   question=QuestionDetail.from_orm(question))
+        if prefetch:
+            data.next_replies = replies[1:]
+        return QuestionRepliesResponse(message="Success", detail="查询成功", data=data).dict(exclude_unset=True)
+
+    return response_cache.respond(request, build, [question_tag(sn)])
 
 
 @infront.get("/search", summary="搜索筛选")
 def search(
-    sn: int,
-    type: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    sn: Optional[int] = None,
+    type: str = "all",
+    keyword: Optional[str] = Query(None, min_length=1, max_length=50),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db),
 ):
-    if type == "question":
-        data = get_sn(db, sn)
-        if not data:
-            raise HTTPException(status_code=404, detail="问题不存在")
-        if data.status != "已通过":
-            raise HTTPException(status_code=404, detail="此问题未通过")
+    def build():
+        # 带关键词时按内容全文搜索
+        if keyword is not None:
+            if type not in ("all", "question", "reply"):
+                raise HTTPException(status_code=400, detail="搜索方式错误")
+            total, items = search_content(db, keyword, None if type == "all" else type, page, limit)
+            return {
+                "message": "Success",
+                "data": {"total": total, "page": page, "items": items},
+            }
+        if sn is None:
+            raise HTTPException(status_code=400, detail="请提供序号或关键词")
+        if type == "question":
+            data = get_question_row(db, sn)
+            if not data:
+                raise HTTPException(status_code=404, detail="问题不存在")
+            if data["status"] != "已通过":
+                raise HTTPException(status_code=404, detail="此问题未通过")
+        elif type == "reply":
+            data = get_reply_row(db, sn)
+            if not data:
+                raise HTTPException(status_code=404, detail="此回复或已被删除")
+            if data["status"] != "已通过":
+                raise HTTPException(status_code=404, detail="此回复未通过")
+        else:
+            raise HTTPException(status_code=400, detail="搜索方式错误")
+        return {
+            "message": "Success",
+            "data": data,
+        }
+
+    if keyword is not None:
+        tags = [SEARCH_TAG]
     elif type == "reply":
-        data = get_reply_by_id(db, sn, "")
-        if data.status != "已通过":
-            raise HTTPException(status_code=404, detail="此回复未通过")
+        tags = [reply_tag(sn)]
     else:
-        raise HTTPException(status_code=400, detail="搜索方式错误")
-    data.source = ""
-    return {
-        "message": "Success",
-        "data": data,
-    }
+        tags = [question_tag(sn)]
+    return response_cache.respond(request, build, tags)
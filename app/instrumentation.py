@@ -0,0 +1,174 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+from __strange_you_database__ import database
+
+logger = logging.getLogger(__name__)
+
+# 单个请求执行的 SQL 条数超过该值时告警，用于发现 N+1 查询
+SQL_QUERY_WARN_THRESHOLD = int(os.getenv("SQL_QUERY_WARN_THRESHOLD", "10"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# 单个请求的数据库开销
+class RequestStats:
+
+    def __init__(self):
+        self.sql_count = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def server_timing(self, elapsed: float):
+        return 'app;dur=%.1f, db;dur=%.1f;desc="%d queries", pool;dur=%.1f' % (
+            elapsed * 1000, self.db_seconds * 1000, self.sql_count, self.pool_wait_seconds * 1000)
+
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+# 按路由汇总的请求耗时直方图以及 SQL 条数、数据库耗时、取连接等待时间
+class RouteMetrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, elapsed: float, stats: RequestStats):
+        with self._lock:
+            entry = self._routes.get((method, route))
+            if entry is None:
+                entry = self._routes[(method, route)] = {
+                    "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                    "sql": 0, "db": 0.0, "pool_wait": 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    entry["buckets"][i] += 1
+            entry["count"] += 1
+            entry["sum"] += elapsed
+            entry["sql"] += stats.sql_count
+            entry["db"] += stats.db_seconds
+            entry["pool_wait"] += stats.pool_wait_seconds
+
+    # 输出 Prometheus 文本格式，components 为各组件 stats() 的结果，数值项导出为 gauge
+    def render(self, components: dict):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = {key: dict(entry, buckets=list(entry["buckets"])) for key, entry in self._routes.items()}
+        for (method, route), entry in sorted(routes.items()):
+            labels = 'method="%s",route="%s"' % (method, route)
+            for bound, count in zip(self.buckets, entry["buckets"]):
+                lines.append('http_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('http_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, entry["count"]))
+            lines.append("http_request_duration_seconds_sum{%s} %f" % (labels, entry["sum"]))
+            lines.append("http_request_duration_seconds_count{%s} %d" % (labels, entry["count"]))
+        for name, key, help_text in (
+                ("http_request_sql_statements_total", "sql", "SQL statements executed by route."),
+                ("http_request_db_seconds_total", "db", "Time spent in SQL by route."),
+                ("http_request_pool_wait_seconds_total", "pool_wait", "Time spent waiting for a pooled connection.")):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s counter" % name)
+            for (method, route), entry in sorted(routes.items()):
+                lines.append('%s{method="%s",route="%s"} %s' % (name, method, route, entry[key]))
+        lines.append("# HELP app_component_stat Internal cache, pool and queue statistics.")
+        lines.append("# TYPE app_component_stat gauge")
+        for component, stat in _flatten(components):
+            for name, value in stat.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append('app_component_stat{component="%s",name="%s"} %s' % (component, name, value))
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(components: dict, prefix: str = ""):
+    for name, stat in components.items():
+        if isinstance(stat, list):
+            for i, item in enumerate(stat):
+                yield from _flatten({"%s%s.%d" % (prefix, name, i): item})
+        elif isinstance(stat, dict) and any(isinstance(value, (dict, list)) for value in stat.values()):
+            yield from _flatten(stat, prefix + name + ".")
+        elif isinstance(stat, dict):
+            yield prefix + name, stat
+
+
+route_metrics = RouteMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.db_seconds += time.perf_counter() - context._query_start
+
+
+def _record_pool_wait(waited: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.pool_wait_seconds += waited
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_path(scope):
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+# 记录每个请求的耗时与数据库开销，写入 Server-Timing 响应头并汇总到 route_metrics
+class InstrumentationMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = _route_path(scope)
+            route_metrics.observe(scope["method"], route, elapsed, stats)
+            if stats.sql_count > SQL_QUERY_WARN_THRESHOLD:
+                logger.warning("%s %s 执行了 %d 条 SQL，可能存在 N+1 查询",
+                               scope["method"], route, stats.sql_count)
+
+
+def setup_instrumentation(app):
+    for engine in [database.engine] + database.replica_engines:
+        instrument_engine(engine)
+    database.pool_wait_listeners.append(_record_pool_wait)
+    app.add_middleware(InstrumentationMiddleware)
@@ -0,0 +1,41 @@
+# 对比两次压测结果：python -m benchmark.compare base.json new.json
+import argparse
+import json
+
+METRICS = ("throughput", "p50_ms", "p95_ms", "p99_ms")
+
+
+def change(old, new):
+    if not old:
+        return "     -"
+    return "%+6.1f%%" % ((new - old) / old * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次压测结果")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print("base: %s  new: %s" % (base.get("commit"), new.get("commit")))
+    print("%-26s" % "route" + "".join("%24s" % metric for metric in METRICS))
+    routes = sorted(set(base["routes"]) | set(new["routes"]))
+    for name in routes + ["total"]:
+        old_route = base["total"] if name == "total" else base["routes"].get(name, {})
+        new_route = new["total"] if name == "total" else new["routes"].get(name, {})
+        cells = []
+        for metric in METRICS:
+            old, value = old_route.get(metric), new_route.get(metric)
+            if old is None or value is None:
+                cells.append("%24s" % "-")
+            else:
+                cells.append("%9.1f ->%7.1f %s" % (old, value, change(old, value)))
+        print("%-26s" % name + "".join(cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+# 生成测试数据：python -m benchmark.datagen --users 100000 --questions 1000000 --replies 5000000
+# 同一 seed 生成的数据完全相同，默认写入 DATABASE_URL 指向的库（MySQL 或 SQLite）。
+# 问题与回复的主键从表中现有最大值之后开始分配，可在已有数据上追加
+import argparse
+import array
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUBJECTS = ["最近", "考试周", "今天", "毕业以后", "实习的时候", "晚上", "周末", "开学前"]
+FEELINGS = ["有点焦虑", "很开心", "不知道该怎么办", "想找人聊聊", "睡不着", "压力很大", "突然很想家"]
+ENDINGS = ["大家会怎么做呢？", "有没有人有同样的感受？", "想听听你们的建议。", "", "怎么调整比较好？"]
+REPLIES = ["加油，一切都会好起来的", "我也经历过，慢慢就好了", "抱抱你", "可以试着和朋友聊聊",
+           "早点休息，别想太多", "相信自己", "出去走走吧，会轻松很多", "你已经做得很好了"]
+NAMES = ["匿名", "路人", "小透明", "同学", "过客"]
+STATUSES = ("已通过", "待审批", "未通过")
+
+
+# 数据集参数。hot_questions 个热门问题分走 hot_share 比例的回复，其余回复均匀分布；
+# 状态比例依次为 已通过、待审批、未通过 的权重
+class DatasetSpec:
+
+    def __init__(self, users: int = 1000, questions: int = 10000, replies: int = 100000,
+                 hot_questions: int = 10, hot_share: float = 0.3,
+                 question_status=(80, 15, 5), reply_status=(70, 25, 5),
+                 days: int = 365, seed: int = 1, user_prefix: str = "g"):
+        self.users = users
+        self.questions = questions
+        self.replies = replies
+        self.hot_questions = min(hot_questions, questions)
+        self.hot_share = hot_share if self.hot_questions else 0.0
+        self.question_status = question_status
+        self.reply_status = reply_status
+        self.days = days
+        self.seed = seed
+        self.user_prefix = user_prefix
+
+    def user_number(self, i: int):
+        return "%s%07d" % (self.user_prefix, i)
+
+
+def generate_users(spec: DatasetSpec):
+    rng = random.Random("%s-users" % spec.seed)
+    for i in range(spec.users):
+        yield {"student_number": spec.user_number(i), "username": "用户%d" % i,
+               "openid": "%030x" % rng.getrandbits(120)}
+
+
+# question_days 记录每个问题距今的天数，回复日期不早于所属问题；approved 记录已通过问题的下标
+def generate_questions(spec: DatasetSpec, first_sn: int, question_days, approved):
+    rng = random.Random("%s-questions" % spec.seed)
+    for i in range(spec.questions):
+        days = rng.randrange(spec.days)
+        question_days.append(days)
+        # 热门问题必定已通过，否则无法被回复
+        status = STATUSES[0] if i < spec.hot_questions else rng.choices(STATUSES, spec.question_status)[0]
+        if status == STATUSES[0]:
+            approved.append(i)
+        yield {"sn": first_sn + i,
+               "question": "%s%s，%s" % (rng.choice(SUBJECTS), rng.choice(FEELINGS), rng.choice(ENDINGS)),
+               "source": spec.user_number(rng.randrange(spec.users)),
+               "name": rng.choice(NAMES),
+               "status": status,
+               "date": date.today() - timedelta(days=days)}
+
+
+# 已通过的回复只挂在已通过的问题下，与线上只能回复已通过问题一致
+def generate_replies(spec: DatasetSpec, first_sn: int, first_id: int, question_days, approved):
+    rng = random.Random("%s-replies" % spec.seed)
+    for i in range(spec.replies):
+        status = rng.choices(STATUSES, spec.reply_status)[0]
+        if status == STATUSES[0] and not approved:
+            status = STATUSES[1]
+        if rng.random() < spec.hot_share:
+            index = rng.randrange(spec.hot_questions)
+        elif status == STATUSES[0]:
+            index = approved[rng.randrange(len(approved))]
+        else:
+            index = rng.randrange(spec.questions)
+        days = rng.randint(0, question_days[index])
+        yield {"id": first_id + i,
+               "name": rng.choice(NAMES),
+               "content": "%s，%s" % (rng.choice(REPLIES), rng.choice(REPLIES)),
+               "source": spec.user_number(rng.randrange(spec.users)),
+               "status": status,
+               "date": date.today() - timedelta(days=days),
+               "question_id": first_sn + index}
+
+
+def chunked(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# 开启一个事务，MySQL 下在其中关闭唯一性与外键检查以加快写入。
+# 这两个是会话变量，连接归还连接池后仍然生效，结束时无论成功与否都要恢复
+@contextlib.contextmanager
+def bulk_load(engine):
+    with engine.begin() as conn:
+        if engine.dialect.name != "mysql":
+            yield conn
+            return
+        conn.exec_driver_sql("SET unique_checks = 0, foreign_key_checks = 0")
+        try:
+            yield conn
+        finally:
+            conn.exec_driver_sql("SET unique_checks = 1, foreign_key_checks = 1")
+
+
+# 按块 executemany 写入，每块一个事务；MySQL 驱动会把 executemany 改写为多行 INSERT
+def insert_rows(engine, table, rows, chunk_size: int, progress=None):
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        with bulk_load(engine) as conn:
+            conn.execute(table.insert(), chunk)
+        total += len(chunk)
+        if progress:
+            progress(table.name, total)
+    return total
+
+
+def _tsv_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+# MySQL 的 LOAD DATA LOCAL INFILE：先按块写入临时文件再整文件导入，状态列直接写入编码
+def load_data_rows(engine, table, rows, chunk_size: int, progress=None):
+    from __strange_you_database__.models import STATUS_CODES
+
+    columns = [column.name for column in table.columns if column.server_default is None]
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".tsv", delete=False) as f:
+            for row in chunk:
+                values = [STATUS_CODES[row[name]] if name == "status" else row.get(name) for name in columns]
+                f.write("\t".join(_tsv_value(value) for value in values) + "\n")
+        try:
+            with bulk_load(engine) as conn:
+                conn.exec_driver_sql(
+                    "LOAD DATA LOCAL INFILE '%s' INTO TABLE %s CHARACTER SET utf8mb4 (%s)"
+                    % (f.name.replace("\\", "/"), table.name, ", ".join(columns)))
+        finally:
+            os.unlink(f.name)
+        total += len(chunk)
+        if progress:
+            progress(table.name, total)
+    return total
+
+
+def _next_key(engine, column):
+    from sqlalchemy import func, select
+
+    with engine.connect() as conn:
+        return (conn.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+# 生成并写入整个数据集，最后重建问题表中的回复计数，返回各表写入行数
+def load_dataset(engine, spec: DatasetSpec, chunk_size: int = 5000, method: str = "insert", progress=None):
+    from __strange_you_database__ import models
+    from __strange_you_database__.crud import rebuild_reply_counters
+    from sqlalchemy.orm import Session
+
+    write = load_data_rows if method == "load-data" else insert_rows
+    first_sn = _next_key(engine, models.Question.sn)
+    first_id = _next_key(engine, models.Reply.id)
+    question_days = array.array("H")
+    approved = array.array("I")
+    counts = {
+        "users": write(engine, models.User.__table__, generate_users(spec), chunk_size, progress),
+        "questions": write(engine, models.Question.__table__,
+                           generate_questions(spec, first_sn, question_days, approved), chunk_size, progress),
+    }
+    if spec.questions:
+        counts["replies"] = write(engine, models.Reply.__table__,
+                                  generate_replies(spec, first_sn, first_id, question_days, approved),
+                                  chunk_size, progress)
+    with Session(engine) as db:
+        rebuild_reply_counters(db)
+    return counts
+
+
+def _weights(text: str):
+    weights = tuple(float(value) for value in text.split(","))
+    if len(weights) != len(STATUSES):
+        raise argparse.ArgumentTypeError("需要 %d 个权重，依次对应 %s" % (len(STATUSES), "、".join(STATUSES)))
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成确定性的测试数据并批量写入数据库")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--replies", type=int, default=100000)
+    parser.add_argument("--hot-questions", type=int, default=10, help="热门问题数")
+    parser.add_argument("--hot-share", type=float, default=0.3, help="热门问题分得的回复比例")
+    parser.add_argument("--question-status", type=_weights, default=(80, 15, 5), help="已通过,待审批,未通过 的权重")
+    parser.add_argument("--reply-status", type=_weights, default=(70, 25, 5), help="已通过,待审批,未通过 的权重")
+    parser.add_argument("--days", type=int, default=365, help="日期分布在最近多少天内")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--user-prefix", default="g", help="生成的学号前缀，避免与已有用户冲突")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--method", choices=["insert", "load-data"], default="insert",
+                        help="load-data 仅适用于 MySQL，需服务端开启 local_infile")
+    parser.add_argument("--database-url", help="默认使用环境变量 DATABASE_URL")
+    parser.add_argument("--create-tables", action="store_true", help="写入前按模型建表（SQLite 空库使用）")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from sqlalchemy import create_engine
+    from __strange_you_database__ import models
+    from __strange_you_database__.database import SQLALCHEMY_DATABASE_URL, engine
+
+    if args.method == "load-data":
+        if engine.dialect.name != "mysql":
+            parser.error("load-data 仅适用于 MySQL")
+        engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"local_infile": 1})
+    if args.create_tables:
+        models.Base.metadata.create_all(bind=engine)
+
+    spec = DatasetSpec(users=args.users, questions=args.questions, replies=args.replies,
+                       hot_questions=args.hot_questions, hot_share=args.hot_share,
+                       question_status=args.question_status, reply_status=args.reply_status,
+                       days=args.days, seed=args.seed, user_prefix=args.user_prefix)
+    start = time.perf_counter()
+
+    def progress(table, total):
+        print("\r%-10s %10d 行  %.1fs" % (table, total, time.perf_counter() - start), end="", flush=True)
+
+    counts = load_dataset(engine, spec, args.chunk_size, args.method, progress)
+    print()
+    elapsed = time.perf_counter() - start
+    print("写入完成：%s，用时 %.1fs" % ("，".join("%s %d 行" % item for item in counts.items()), elapsed))
+
+
+if __name__ == '__main__':
+    main()
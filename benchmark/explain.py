@@ -0,0 +1,126 @@
+# 执行计划：python -m benchmark.explain --questions 2000 --replies 20000
+# 未设置 DATABASE_URL 时在临时 SQLite 库上建表并写入测试数据；指向已有库时加 --no-seed 直接使用现有数据。
+# 依次调用 crud 的热点查询，记录其实际执行的 SQL，再以 EXPLAIN（SQLite 为 EXPLAIN QUERY PLAN）输出执行计划
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 各热点查询：名称到调用方式，参数为会话与样本（热门问题序号、回复 id、用户学号）
+def explained_queries():
+    from __strange_you_database__ import crud
+    from __strange_you_database__.moderation import question_queue, reply_queue
+    from __strange_you_database__.reply_index import reply_index
+
+    def reply_ids(db, sample):
+        reply_index.invalidate(sample["sn"])
+        return crud.get_replies_by_question(db, 1, sample["sn"], 5)
+
+    def question_with_replies(db, sample):
+        reply_index.invalidate(sample["sn"])
+        return crud.get_question_with_replies(db, sample["sn"], 1, 5)
+
+    return {
+        "弹幕墙问题池 QuestionPool.load": lambda db, sample: crud.question_pool.load(db),
+        "弹幕墙取问题 get_screen_questions": lambda db, sample: crud.get_screen_questions(db),
+        "回复索引 + 按序取回复 get_replies_by_question": reply_ids,
+        "问题详情 get_question_with_replies": question_with_replies,
+        "回复所属问题 get_reply_with_question": lambda db, sample: crud.get_reply_with_question(db, sample["id"]),
+        "问题回复首页 get_reply_after": lambda db, sample: crud.get_reply_after(db, sample["sn"], None, 10),
+        "问题回复翻页 get_reply": lambda db, sample: crud.get_reply(db, sample["sn"], 3, 10),
+        "最新回复 get_latest_reply_ids": lambda db, sample: crud.get_latest_reply_ids(db, [sample["sn"]]),
+        "回复计数 get_reply_num": lambda db, sample: crud.get_reply_num(db, sample["sn"]),
+        "后台问题翻页 get_questions": lambda db, sample: crud.get_questions(db, 3, 10),
+        "我的问题 get_ones_questions_after": lambda db, sample: crud.get_ones_questions_after(
+            db, sample["source"], None, 10),
+        "我的回复 get_ones_replies_after": lambda db, sample: crud.get_ones_replies_after(
+            db, sample["source"], None, 10),
+        "问题审核认领 question_queue.claim": lambda db, sample: question_queue.claim(db, "explain", 10),
+        "回复审核认领 reply_queue.claim": lambda db, sample: reply_queue.claim(db, "explain", 10),
+    }
+
+
+# 取热门问题（已通过回复最多）及其一条回复、回复者作为查询参数
+def pick_sample(db):
+    from sqlalchemy import func
+    from __strange_you_database__.models import Reply
+
+    sn, = db.query(Reply.question_id).filter(Reply.status == "已通过").group_by(Reply.question_id) \
+        .order_by(func.count().desc()).first()
+    reply_id, source = db.query(Reply.id, Reply.source).filter(Reply.question_id == sn) \
+        .order_by(Reply.id.desc()).first()
+    return {"sn": sn, "id": reply_id, "source": source}
+
+
+def capture(engine, call):
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def explain(engine, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(prefix + statement, parameters)
+        return list(result.keys()), [tuple(row) for row in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="“陌生的你”热点查询执行计划")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--replies", type=int, default=20000)
+    parser.add_argument("--hot-questions", type=int, default=10)
+    parser.add_argument("--no-seed", action="store_true", help="使用 DATABASE_URL 指向的已有数据，不建表也不写入")
+    args = parser.parse_args()
+
+    if "DATABASE_URL" not in os.environ:
+        workdir = tempfile.mkdtemp(prefix="explain-")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "explain.db")
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    from __strange_you_database__ import models
+    from __strange_you_database__.database import SessionLocal, engine
+    from benchmark.datagen import DatasetSpec, load_dataset
+
+    if not args.no_seed:
+        models.Base.metadata.create_all(bind=engine)
+        load_dataset(engine, DatasetSpec(users=args.users, questions=args.questions, replies=args.replies,
+                                         hot_questions=args.hot_questions))
+    # 让优化器使用最新的统计信息
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE" if engine.dialect.name == "sqlite" else "ANALYZE TABLE question, reply")
+
+    db = SessionLocal()
+    try:
+        sample = pick_sample(db)
+        for name, call in explained_queries().items():
+            print("== %s" % name)
+            for statement, parameters in capture(engine, lambda: call(db, sample)):
+                print("  " + " ".join(statement.split()))
+                columns, rows = explain(engine, statement, parameters)
+                for row in rows:
+                    print("    " + " | ".join("%s=%s" % (column, value) for column, value in zip(columns, row)
+                                             if value is not None))
+            db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
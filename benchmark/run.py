@@ -0,0 +1,470 @@
+# 压测：python -m benchmark.run --users 200 --questions 2000 --replies 20000 --duration 30 --output result.json
+# 在临时目录中建立 SQLite 数据库并用 benchmark.datagen 写入测试数据，进程内启动 main.py 的 app，按流量配比并发请求，
+# 输出各路由的吞吐量与 p50/p95/p99，结果以 JSON 保存，可用 python -m benchmark.compare 对比。
+# --scenario sampling 不启动服务，在 --sizes 给出的各问题数下直接测量弹幕墙取问题的延迟；
+# --scenario slow-query 先正常压测一轮，再在另有线程反复触发慢查询的情况下压测一轮，对比两轮的延迟；
+# --scenario search 不启动服务，在生成的语料上对比本地倒排索引与 LIKE 扫描的搜索延迟
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmark.datagen import DatasetSpec, load_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANAGER = "admin"
+
+# 流量配比：场景名到权重
+MIXES = {
+    # 小程序端为主：弹幕墙与回复翻页占大头，少量提交与后台审核
+    "default": {
+        "bullet_screen": 30, "reply_swipe": 30, "reply_question": 5, "search": 5,
+        "submit_question": 5, "submit_reply": 10,
+        "admin_questions": 5, "admin_replies": 5, "admin_examine": 5,
+    },
+    "read": {"bullet_screen": 40, "reply_swipe": 40, "reply_question": 10, "search": 10},
+    "write": {"submit_question": 30, "submit_reply": 60, "reply_swipe": 10},
+    "admin": {"admin_questions": 30, "admin_replies": 30, "admin_examine": 40},
+    # 后台按页码翻页：第 1 页与深页的延迟应当相同，深页需 --questions 不少于 DEEP_PAGE * PAGE_LIMIT
+    "pagination": {"admin_questions_first": 1, "admin_questions_deep": 1,
+                   "admin_replies_first": 1, "admin_replies_deep": 1},
+    # 同上，同时有新问题与新回复提交，页边界缓存不应因新提交而反复重建
+    "pagination_write": {"admin_questions_first": 2, "admin_questions_deep": 2,
+                         "admin_replies_first": 2, "admin_replies_deep": 2,
+                         "submit_question": 1, "submit_busiest_reply": 1},
+}
+
+# 搜索对比的关键词：报告中的名称到关键词，含常见词、长词、少见词、单字与不存在的词
+SEARCH_KEYWORDS = {"common": "加油", "common_long": "抱抱你", "phrase": "压力很大", "rare": "想家",
+                   "single_char": "家", "missing": "量子力学"}
+
+# 翻页对比的每页条数与深页页码，数据不足时取最后一页
+PAGE_LIMIT = 10
+DEEP_PAGE = 10000
+
+
+# 准备运行目录与数据库，需在导入项目模块之前调用
+def prepare_workspace(workdir: str):
+    for path in ("dist", os.path.join("dist", "assets")):
+        os.makedirs(os.path.join(workdir, path), exist_ok=True)
+    with open(os.path.join(workdir, "dist", "index.html"), "w") as index:
+        index.write("<html></html>")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "benchmark.db")
+    os.environ.setdefault("INGEST_JOURNAL_DIR", os.path.join(workdir, "ingest-journal"))
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+# 用 datagen 生成测试数据，并加入压测用的管理员
+def seed_database(spec):
+    from __strange_you_database__ import models
+    from __strange_you_database__.database import SessionLocal, engine
+    from __strange_you_database__.utils import hash_password
+
+    models.Base.metadata.create_all(bind=engine)
+    load_dataset(engine, spec)
+    db = SessionLocal()
+    try:
+        db.add(models.Administrator(student_number=MANAGER, administratorname="压测",
+                                    hashed_password=hash_password("benchmark")))
+        db.commit()
+    finally:
+        db.close()
+
+
+# 读取压测时需要的 id：已通过的问题及其可见回复数、回复 id、用户（学号与用户名），以及翻页对比的深页页码
+def load_targets():
+    from __strange_you_database__ import models
+    from __strange_you_database__.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        questions = db.query(models.Question.sn, models.Question.approved_num) \
+            .filter(models.Question.status == "已通过").all()
+        question_count = db.query(models.Question).count()
+        replied = models.Question.approved_num + models.Question.pending_num + models.Question.rejected_num
+        busiest = db.query(models.Question.sn, replied).order_by(replied.desc()).first()
+        return {
+            "questions": [sn for sn, _ in questions],
+            "hot_questions": [(sn, num) for sn, num in questions if num > 0],
+            "replies": [reply_id for reply_id, in db.query(models.Reply.id).filter(models.Reply.status == "已通过")],
+            "users": db.query(models.User.student_number, models.User.username).all(),
+            "deep_question_page": min(DEEP_PAGE, max(1, -(-question_count // PAGE_LIMIT))),
+            "busiest_question": busiest[0] if busiest else None,
+            "deep_reply_page": min(DEEP_PAGE, max(1, -(-busiest[1] // PAGE_LIMIT))) if busiest else 1,
+        }
+    finally:
+        db.close()
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 各场景发出一次请求，返回响应
+def bullet_screen(client, base, targets, rng):
+    return client.get(base + "/infront/bullet-screen")
+
+
+def reply_swipe(client, base, targets, rng):
+    sn, num = rng.choice(targets["hot_questions"])
+    return client.get(base + "/infront/question/%d" % sn, params={"id": rng.randint(1, num), "prefetch": 2})
+
+
+def reply_question(client, base, targets, rng):
+    return client.get(base + "/infront/reply-question", params={"id": rng.choice(targets["replies"])})
+
+
+def search(client, base, targets, rng):
+    return client.get(base + "/infront/search", params={"keyword": rng.choice(["今天", "加油", "怎么样"])})
+
+
+def submit_question(client, base, targets, rng):
+    return client.post(base + "/infront/question", json={"question": "新的压测问题", "name": "匿名"})
+
+
+def submit_reply(client, base, targets, rng):
+    return client.post(base + "/infront/reply",
+                       json={"name": "匿名", "content": "新的压测回复", "question_id": rng.choice(targets["questions"])})
+
+
+def admin_questions(client, base, targets, rng):
+    return client.get(base + "/background/questions", params={"page": rng.randint(1, 5), "limit": 20})
+
+
+def admin_replies(client, base, targets, rng):
+    sn, _ = rng.choice(targets["hot_questions"])
+    return client.get(base + "/background/replies", params={"question_sn": sn, "limit": 20})
+
+
+def submit_busiest_reply(client, base, targets, rng):
+    return client.post(base + "/infront/reply",
+                       json={"name": "匿名", "content": "新的压测回复", "question_id": targets["busiest_question"]})
+
+
+def admin_questions_first(client, base, targets, rng):
+    return client.get(base + "/background/questions", params={"page": 1, "limit": PAGE_LIMIT})
+
+
+def admin_questions_deep(client, base, targets, rng):
+    return client.get(base + "/background/questions",
+                      params={"page": targets["deep_question_page"], "limit": PAGE_LIMIT})
+
+
+def admin_replies_first(client, base, targets, rng):
+    return client.get(base + "/background/replies",
+                      params={"question_sn": targets["busiest_question"], "page": 1, "limit": PAGE_LIMIT})
+
+
+def admin_replies_deep(client, base, targets, rng):
+    return client.get(base + "/background/replies", params={
+        "question_sn": targets["busiest_question"], "page": targets["deep_reply_page"], "limit": PAGE_LIMIT})
+
+
+def admin_examine(client, base, targets, rng):
+    items = [{"sn": rng.choice(targets["replies"]), "status": rng.choice(["已通过", "未通过"])} for _ in range(5)]
+    return client.put(base + "/background/replies", json=items)
+
+
+SCENARIOS = {func.__name__: func for func in (
+    bullet_screen, reply_swipe, reply_question, search, submit_question, submit_reply,
+    admin_questions, admin_replies, admin_examine,
+    admin_questions_first, admin_questions_deep, admin_replies_first, admin_replies_deep, submit_busiest_reply)}
+
+
+# 单个压测线程：按配比随机选择场景，直到截止时间，记录 (场景, 耗时, 是否成功)
+def worker(base, targets, mix, tokens, deadline, seed, samples):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    user_client = requests.Session()
+    user_client.headers["Authorization"] = "Bearer " + rng.choice(tokens["users"])
+    manager_client = requests.Session()
+    manager_client.headers["Authorization"] = "Bearer " + tokens["manager"]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        client = manager_client if name.startswith("admin") else user_client
+        start = time.perf_counter()
+        try:
+            ok = SCENARIOS[name](client, base, targets, rng).status_code < 400
+        except requests.RequestException:
+            ok = False
+        samples.append((name, time.perf_counter() - start, ok))
+
+
+# 按配比并发压测 duration 秒，返回样本
+def run_load(base, targets, mix, tokens, duration: float, concurrency: int, seed: int):
+    samples = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(base, targets, mix, tokens, deadline, seed * 1000 + i, samples))
+               for i in range(concurrency)]
+    for worker_thread in threads:
+        worker_thread.start()
+    for worker_thread in threads:
+        worker_thread.join()
+    return samples
+
+
+# 慢查询：查询管理员表的语句人为延迟 delay 秒，模拟 MySQL 上的一条慢查询
+def slow_administrator_queries(delay: float):
+    def slow(conn, cursor, statement, parameters, context, executemany):
+        if "FROM administrator" in statement:
+            time.sleep(delay)
+    return slow
+
+
+# 反复用不存在的账号登录后台，每次都会执行一条慢查询，直到截止时间
+def slow_worker(base, deadline, samples):
+    client = requests.Session()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            ok = client.post(base + "/background/managers/login",
+                             data={"username": "nobody", "password": "benchmark"}).status_code == 401
+        except requests.RequestException:
+            ok = False
+        samples.append(("slow_login", time.perf_counter() - start, ok))
+
+
+# 先不带慢查询压测一轮，再在 slow_clients 个线程持续触发慢查询时压测一轮；
+# 路由名带 @quiet / @slow 后缀，数据库调用不在事件循环上执行时两轮中其他路由的 p99 应当接近
+def slow_query_load(base, targets, mix, tokens, args):
+    from sqlalchemy import event
+    from __strange_you_database__.database import engine
+
+    samples = [(name + "@quiet", latency, ok) for name, latency, ok in
+               run_load(base, targets, mix, tokens, args.duration, args.concurrency, args.seed)]
+    slow = slow_administrator_queries(args.slow_ms / 1000)
+    event.listen(engine, "before_cursor_execute", slow)
+    slow_samples = []
+    deadline = time.perf_counter() + args.duration
+    slow_threads = [threading.Thread(target=slow_worker, args=(base, deadline, slow_samples))
+                    for _ in range(args.slow_clients)]
+    try:
+        for slow_thread in slow_threads:
+            slow_thread.start()
+        samples += [(name + "@slow", latency, ok) for name, latency, ok in
+                    run_load(base, targets, mix, tokens, args.duration, args.concurrency, args.seed + 1)]
+        for slow_thread in slow_threads:
+            slow_thread.join()
+    finally:
+        event.remove(engine, "before_cursor_execute", slow)
+    return samples + [(name + "@slow", latency, ok) for name, latency, ok in slow_samples]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(samples, duration):
+    routes = {}
+    for name in sorted({name for name, _, _ in samples}):
+        latencies = sorted(latency for sample_name, latency, _ in samples if sample_name == name)
+        errors = sum(1 for sample_name, _, ok in samples if sample_name == name and not ok)
+        routes[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput": len(latencies) / duration,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    latencies = sorted(latency for _, latency, _ in samples)
+    total = {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "throughput": len(samples) / duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    return total, routes
+
+
+# 弹幕墙抽样：问题表逐步扩充到 sizes 中的各个规模，每个规模下重新加载问题池，
+# 测量 rounds 次 get_screen_questions（抽样加按主键取问题）的延迟，延迟不应随问题数增长
+def sampling_benchmark(sizes, rounds: int, seed: int):
+    from __strange_you_database__ import crud, models
+    from __strange_you_database__.database import SessionLocal, engine
+    from __strange_you_database__.sampler import question_pool
+
+    models.Base.metadata.create_all(bind=engine)
+    samples = []
+    loaded = 0
+    db = SessionLocal()
+    try:
+        for i, size in enumerate(sorted(sizes)):
+            if size > loaded:
+                load_dataset(engine, DatasetSpec(users=10, questions=size - loaded, replies=0, seed=seed + i,
+                                                 user_prefix="s%d" % i))
+                loaded = size
+            start = time.perf_counter()
+            question_pool.load(db)
+            print("%d 个问题：问题池加载 %.1f ms，%d 个已通过" % (size, (time.perf_counter() - start) * 1000,
+                                                       len(question_pool)))
+            name = "screen_questions@%d" % size
+            for _ in range(rounds):
+                start = time.perf_counter()
+                ok = len(crud.get_screen_questions(db)) == crud.SCREEN_BATCH_SIZE
+                samples.append((name, time.perf_counter() - start, ok))
+                db.rollback()
+    finally:
+        db.close()
+    return samples
+
+
+# 关键词搜索：从库中全量构建本地倒排索引，每个关键词分别用索引搜索 rounds 次、
+# 用 LIKE 扫描（索引建好前的兜底路径）搜索 like_rounds 次，取第一页 20 条
+def search_benchmark(keywords, rounds: int, like_rounds: int):
+    from __strange_you_database__.database import SessionLocal
+    from __strange_you_database__.search import LocalSearchIndex
+
+    index = LocalSearchIndex()
+    start = time.perf_counter()
+    index.rebuild()
+    stats = index.stats()
+    print("索引构建 %.1f s：%d 篇文档，%d 个词元" % (time.perf_counter() - start, stats["documents"], stats["tokens"]))
+    samples = []
+    db = SessionLocal()
+    try:
+        for label, keyword in keywords.items():
+            for name, search, times in (("index", index.search, rounds), ("like", index._scan, like_rounds)):
+                for _ in range(times):
+                    start = time.perf_counter()
+                    total, _ = search(db, keyword, None, 1, 20)
+                    samples.append(("%s:%s" % (name, label), time.perf_counter() - start, True))
+                    db.rollback()
+                print("%s:%s（%s）命中 %d 条" % (name, label, keyword, total))
+    finally:
+        db.close()
+    return samples
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(total, routes):
+    print("%-26s %8s %7s %9s %9s %9s %9s" % ("route", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, route in list(routes.items()) + [("total", total)]:
+        print("%-26s %8d %7d %9.1f %9.2f %9.2f %9.2f" % (
+            name, route["requests"], route["errors"], route["throughput"],
+            route["p50_ms"], route["p95_ms"], route["p99_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="“陌生的你”后端压测")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--replies", type=int, default=20000)
+    parser.add_argument("--hot-questions", type=int, default=10, help="热门问题数")
+    parser.add_argument("--hot-share", type=float, default=0.3, help="热门问题分得的回复比例")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--warmup", type=float, default=3, help="预热时长（秒），不计入结果")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--scenario", choices=("load", "sampling", "slow-query", "search"), default="load",
+                        help="load 为按流量配比压测；sampling 为弹幕墙抽样的规模对比；"
+                             "slow-query 为有无慢查询时的延迟对比；search 为索引与 LIKE 扫描的搜索延迟对比")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="sampling 场景的问题数，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=2000, help="sampling 场景每个规模的请求次数")
+    parser.add_argument("--search-rounds", type=int, default=50, help="search 场景每个关键词的索引搜索次数")
+    parser.add_argument("--like-rounds", type=int, default=3, help="search 场景每个关键词的 LIKE 扫描次数")
+    parser.add_argument("--slow-ms", type=float, default=500, help="slow-query 场景中每条慢查询的耗时（毫秒）")
+    parser.add_argument("--slow-clients", type=int, default=4, help="slow-query 场景中持续触发慢查询的线程数")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    prepare_workspace(workdir)
+    if args.scenario == "sampling":
+        samples = sampling_benchmark([int(size) for size in args.sizes.split(",")], args.rounds, args.seed)
+        # 请求逐个串行发出，吞吐量按请求耗时之和计算
+        report(args, output, samples, sum(latency for _, latency, _ in samples))
+        return
+    spec = DatasetSpec(users=args.users, questions=args.questions, replies=args.replies,
+                       hot_questions=args.hot_questions, hot_share=args.hot_share, seed=args.seed)
+    if args.scenario == "search":
+        seed_database(spec)
+        samples = search_benchmark(SEARCH_KEYWORDS, args.search_rounds, args.like_rounds)
+        report(args, output, samples, sum(latency for _, latency, _ in samples))
+        return
+    import main as application
+    from app.background import manager_token
+    from app.infront import user_token
+
+    seed_database(spec)
+    rng = random.Random(args.seed)
+    targets = load_targets()
+    # 与登录接口一样签发带类型与版本号的令牌，压测走令牌校验的无查询路径；新库中版本号均为 0
+    tokens = {
+        "users": [user_token(sn, name, 0)
+                  for sn, name in rng.sample(targets["users"], min(len(targets["users"]), args.concurrency * 4))],
+        "manager": manager_token(MANAGER, 0),
+    }
+
+    port = free_port()
+    server, thread = start_server(application.app, port)
+    base = "http://127.0.0.1:%d" % port
+    mix = MIXES[args.mix]
+    try:
+        run_load(base, targets, mix, tokens, args.warmup, args.concurrency, args.seed)
+        if args.scenario == "slow-query":
+            samples = slow_query_load(base, targets, mix, tokens, args)
+        else:
+            samples = run_load(base, targets, mix, tokens, args.duration, args.concurrency, args.seed)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    report(args, output, samples, args.duration)
+
+
+def report(args, output, samples, duration):
+    total, routes = summarize(samples, duration)
+    print_report(total, routes)
+    if output:
+        result = {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+            "total": total,
+            "routes": routes,
+        }
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# 列表接口序列化开销对比：python -m benchmark.serialization --rows 20 100 500
+# 对比旧路径（查询整行 ORM 对象，经 response_model 校验、jsonable_encoder 后用标准 json 输出）
+# 与新路径（只查询响应列得到字典，直接用 orjson 输出），分别统计查询加序列化、仅序列化的单次耗时
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+from benchmark.datagen import DatasetSpec, load_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def endpoints(hot_sn: int):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from __strange_you_database__ import crud
+    from __strange_you_database__.models import Question, Reply
+    from __strange_you_database__.schemas import QuestionQuery
+
+    def old_questions(db, n):
+        return db.query(Question).order_by(Question.sn).limit(n).all()
+
+    def old_replies(db, n):
+        return db.query(Reply).filter(Reply.question_id == hot_sn) \
+            .order_by(Reply.date.desc(), Reply.id.desc()).limit(n).all()
+
+    def new_own_questions(db, n):
+        return crud.as_dicts(db.query(Question.sn, Question.question, Question.name, Question.status, Question.date)
+                             .order_by(Question.sn).limit(n))
+
+    # 接口名: (旧查询, 旧序列化, 新查询, 新序列化)
+    return {
+        "/infront/questions": (
+            old_questions,
+            lambda rows: JSONResponse(jsonable_encoder([QuestionQuery.from_orm(row) for row in rows])).body,
+            new_own_questions,
+            lambda rows: ORJSONResponse(rows).body,
+        ),
+        "/background/questions": (
+            old_questions,
+            lambda rows: JSONResponse(jsonable_encoder({"data": {"question_information": rows}})).body,
+            lambda db, n: crud.get_questions_after(db, None, n),
+            lambda rows: ORJSONResponse({"data": {"question_information": rows}}).body,
+        ),
+        "/background/replies": (
+            old_replies,
+            lambda rows: JSONResponse(jsonable_encoder({"data": {"reply_information": rows}})).body,
+            lambda db, n: crud.get_reply_after(db, hot_sn, None, n),
+            lambda rows: ORJSONResponse({"data": {"reply_information": rows}}).body,
+        ),
+    }
+
+
+# 每次调用使用新会话，避免 ORM 的 identity map 让旧路径占便宜，返回单次耗时（微秒）
+def measure(fetch, serialize, rows: int, number: int):
+    from __strange_you_database__.database import SessionLocal
+
+    def full():
+        db = SessionLocal()
+        try:
+            serialize(fetch(db, rows))
+        finally:
+            db.close()
+
+    db = SessionLocal()
+    try:
+        fetched = fetch(db, rows)
+        serialize_only = min(timeit.repeat(lambda: serialize(fetched), number=number, repeat=5)) / number
+    finally:
+        db.close()
+    total = min(timeit.repeat(full, number=number, repeat=5)) / number
+    return total * 1e6, serialize_only * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口序列化开销对比")
+    parser.add_argument("--rows", type=int, nargs="+", default=[20, 100, 500], help="每次返回的行数")
+    parser.add_argument("--number", type=int, default=50, help="每轮调用次数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "serialization.db")
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from __strange_you_database__ import models
+    from __strange_you_database__.database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    rows = max(args.rows)
+    load_dataset(engine, DatasetSpec(users=100, questions=rows * 2, replies=rows * 4, hot_questions=1, hot_share=0.5))
+    with engine.connect() as conn:
+        hot_sn = conn.execute(models.Question.__table__.select().order_by(models.Question.sn).limit(1)).first().sn
+
+    print("%-24s %6s %22s %22s" % ("endpoint", "rows", "fetch+serialize us", "serialize us"))
+    for name, (old_fetch, old_serialize, new_fetch, new_serialize) in endpoints(hot_sn).items():
+        for n in args.rows:
+            old_total, old_only = measure(old_fetch, old_serialize, n, args.number)
+            new_total, new_only = measure(new_fetch, new_serialize, n, args.number)
+            print("%-24s %6d %9.0f -> %9.0f %9.0f -> %9.0f" % (name, n, old_total, new_total, old_only, new_only))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import os
+
 import uvicorn
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
@@ -6,8 +8,21 @@ from starlette.templating import Jinja2Templates
 
 from __strange_you_database__ import models
 from __strange_you_database__.database import engine
+from __strange_you_database__.executor import shutdown_db_executor
+from __strange_you_database__.hasher import password_hasher
+from __strange_you_database__.unified_auth import unified_auth
+from __strange_you_database__.ingest import ingest_queue, INGEST_ENABLED
+from __strange_you_database__.reply_index import reply_index
+from __strange_you_database__.revocation import token_epochs
+from __strange_you_database__.sampler import question_pool
+from __strange_you_database__.search import search_backend
 from app import infront, background
-from fastapi import FastAPI
+from app.instrumentation import setup_instrumentation, route_metrics
+from fastapi import Depends, FastAPI
+from starlette.responses import PlainTextResponse
+
+# 仅供本地开发：启动时按 models 直接建表。生产库的表结构由 alembic 迁移管理
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "off") == "on"
 
 app = FastAPI(
     title="“陌生的你”后端接口文档"
@@ -32,11 +47,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-models.Base.metadata.create_all(bind=engine)
+setup_instrumentation(app)
+
+if DB_CREATE_ALL:
+    models.Base.metadata.create_all(bind=engine)
 
 templates = Jinja2Templates(directory="dist")
 
 
+@app.on_event("startup")
+def startup():
+    token_epochs.start()
+    search_backend.start()
+    question_pool.start()
+    reply_index.start()
+    if INGEST_ENABLED:
+        ingest_queue.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    ingest_queue.stop()
+    token_epochs.stop()
+    search_backend.stop()
+    question_pool.stop()
+    reply_index.stop()
+    shutdown_db_executor()
+    password_hasher.shutdown()
+    unified_auth.shutdown()
+
+
+# Prometheus 指标，与 /background/stats 一样仅限管理员，抓取时以管理员令牌作为 Bearer 认证
+@app.get("/metrics", include_in_schema=False)
+def metrics(current_manager=Depends(background.get_current_manager)):
+    return PlainTextResponse(route_metrics.render(background.collect_stats()),
+                             media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def read_item(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -0,0 +1,60 @@
+"""initial schema
+
+已有的数据库由 create_all 建表，执行 alembic stamp 0001 标记为此版本后再升级。
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-05-06 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("student_number", sa.String(12), primary_key=True, index=True),
+        sa.Column("username", sa.String(20)),
+        sa.Column("openid", sa.String(30), nullable=True),
+    )
+    op.create_table(
+        "administrator",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("student_number", sa.String(12), index=True, unique=True),
+        sa.Column("administratorname", sa.String(20)),
+        sa.Column("hashed_password", sa.String(200)),
+    )
+    op.create_table(
+        "question",
+        sa.Column("sn", sa.Integer, primary_key=True, autoincrement=True, index=True),
+        sa.Column("question", sa.String(200)),
+        sa.Column("source", sa.String(12), sa.ForeignKey("users.student_number"), index=True),
+        sa.Column("name", sa.String(10)),
+        sa.Column("status", sa.String(8)),
+        sa.Column("date", sa.Date),
+    )
+    op.create_table(
+        "reply",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(20)),
+        sa.Column("content", sa.String(1000)),
+        sa.Column("source", sa.String(12), sa.ForeignKey("users.student_number"), index=True),
+        sa.Column("status", sa.String(8)),
+        sa.Column("date", sa.Date),
+        sa.Column("question_id", sa.Integer, sa.ForeignKey("question.sn")),
+    )
+
+
+def downgrade():
+    op.drop_table("reply")
+    op.drop_table("question")
+    op.drop_table("administrator")
+    op.drop_table("users")
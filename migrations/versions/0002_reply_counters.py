@@ -0,0 +1,39 @@
+"""reply counters on question
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+COUNTERS = (
+    ("approved_num", "status = '已通过'"),
+    ("pending_num", "status = '待审批'"),
+    ("rejected_num", "status NOT IN ('已通过', '待审批')"),
+)
+
+
+def upgrade():
+    with op.batch_alter_table("question") as batch_op:
+        for column, _ in COUNTERS:
+            batch_op.add_column(sa.Column(column, sa.Integer, server_default="0", nullable=False))
+    for column, condition in COUNTERS:
+        op.execute(
+            "UPDATE question SET %s = (SELECT COUNT(*) FROM reply "
+            "WHERE reply.question_id = question.sn AND reply.%s)" % (column, condition)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("question") as batch_op:
+        for column, _ in COUNTERS:
+            batch_op.drop_column(column)
@@ -0,0 +1,57 @@
+"""status as small int, composite indexes for hot queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# 与 models.STATUS_CODES 保持一致，迁移脚本不直接引用模型
+STATUS_CODES = {"待审批": 0, "已通过": 1, "未通过": 2}
+REJECTED = STATUS_CODES["未通过"]
+
+
+def _to_code(table):
+    cases = " ".join("WHEN '%s' THEN %d" % (name, code) for name, code in STATUS_CODES.items())
+    op.execute("UPDATE %s SET status_code = CASE status %s ELSE %d END" % (table, cases, REJECTED))
+
+
+def _to_name(table):
+    cases = " ".join("WHEN %d THEN '%s'" % (code, name) for name, code in STATUS_CODES.items())
+    op.execute("UPDATE %s SET status_name = CASE status %s END" % (table, cases))
+
+
+def upgrade():
+    for table in ("question", "reply"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("status_code", sa.SmallInteger, nullable=True))
+        _to_code(table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("status")
+            batch_op.alter_column("status_code", new_column_name="status",
+                                  existing_type=sa.SmallInteger, nullable=False)
+    op.create_index("ix_question_status_sn", "question", ["status", "sn"])
+    op.create_index("ix_reply_question_status_id", "reply", ["question_id", "status", "id"])
+    op.create_index("ix_reply_question_date_id", "reply", ["question_id", "date", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_reply_question_date_id", table_name="reply")
+    op.drop_index("ix_reply_question_status_id", table_name="reply")
+    op.drop_index("ix_question_status_sn", table_name="question")
+    for table in ("question", "reply"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("status_name", sa.String(8), nullable=True))
+        _to_name(table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("status")
+            batch_op.alter_column("status_name", new_column_name="status", existing_type=sa.String(8))
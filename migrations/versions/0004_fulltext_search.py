@@ -0,0 +1,31 @@
+"""fulltext ngram indexes for keyword search
+
+仅在 MySQL 上创建，配合 SEARCH_BACKEND=mysql 使用；其他数据库使用进程内索引。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    op.execute("CREATE FULLTEXT INDEX ft_question_question ON question (question) WITH PARSER ngram")
+    op.execute("CREATE FULLTEXT INDEX ft_reply_content ON reply (content) WITH PARSER ngram")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    op.drop_index("ft_reply_content", table_name="reply")
+    op.drop_index("ft_question_question", table_name="question")
@@ -0,0 +1,32 @@
+"""moderation queue leases
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ("question", "reply"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("claimed_by", sa.String(12), nullable=True))
+            batch_op.add_column(sa.Column("lease_until", sa.DateTime, nullable=True))
+    op.create_index("ix_reply_status_id", "reply", ["status", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_reply_status_id", table_name="reply")
+    for table in ("question", "reply"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("lease_until")
+            batch_op.drop_column("claimed_by")
@@ -0,0 +1,32 @@
+"""token epochs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "token_epochs",
+        sa.Column("kind", sa.String(8), primary_key=True),
+        sa.Column("student_number", sa.String(12), primary_key=True),
+        sa.Column("epoch", sa.Integer, nullable=False),
+        sa.Column("updated_at", sa.DateTime, nullable=False),
+    )
+    op.create_index("ix_token_epochs_updated_at", "token_epochs", ["updated_at"])
+
+
+def downgrade():
+    op.drop_index("ix_token_epochs_updated_at", table_name="token_epochs")
+    op.drop_table("token_epochs")
@@ -0,0 +1,63 @@
+import contextlib
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+# 测试使用临时 SQLite 库，须在导入 database 之前设置
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="tests-"), "test.db")
+
+from __strange_you_database__ import models  # noqa: E402
+from __strange_you_database__.database import engine, SessionLocal  # noqa: E402
+from app.instrumentation import RequestStats, current_request, instrument_engine  # noqa: E402
+
+instrument_engine(engine)
+
+REPLIES_PER_QUESTION = 5
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(bind=engine)
+
+
+# 统计代码块内执行的 SQL 条数，与请求级统计使用同一个游标计数器
+@pytest.fixture
+def count_queries():
+    @contextlib.contextmanager
+    def counting():
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            yield stats
+        finally:
+            current_request.reset(token)
+    return counting
+
+
+# 一个用户、一个已通过的问题及其下 REPLIES_PER_QUESTION 条已通过的回复
+@pytest.fixture
+def question(db):
+    db.add(models.User(student_number="202100000001", username="user"))
+    question = models.Question(question="问题", source="202100000001", name="匿名", status="已通过",
+                               date=date.today(), approved_num=REPLIES_PER_QUESTION)
+    db.add(question)
+    db.flush()
+    db.add_all([models.Reply(name="匿名", content="回复 %d" % i, source="202100000001", status="已通过",
+                             date=date.today(), question_id=question.sn) for i in range(REPLIES_PER_QUESTION)])
+    db.commit()
+    sn = question.sn
+    db.expunge_all()
+    return sn
+
@@ -0,0 +1,37 @@
+from __strange_you_database__ import crud
+from __strange_you_database__.reply_index import reply_index
+
+
+def test_question_with_replies_is_one_statement(db, question, count_queries):
+    # 回复 id 列表来自 reply_index 缓存，先预热，只统计详情查询本身
+    reply_index.invalidate(question)
+    reply_ids = reply_index.get_ids(db, question)
+    with count_queries() as stats:
+        detail = crud.get_question_with_replies(db, question, 2, count=3)
+        contents = [reply.content for reply in detail.replies]
+        owner = detail.question
+    assert stats.sql_count == 1
+    assert [reply.id for reply in detail.replies] == reply_ids[1:4]
+    assert contents == ["回复 1", "回复 2", "回复 3"]
+    assert owner == "问题"
+
+
+def test_question_with_replies_without_replies_is_one_statement(db, question, count_queries):
+    reply_index.get_ids(db, question)
+    with count_queries() as stats:
+        detail = crud.get_question_with_replies(db, question, 0)
+        replies = list(detail.replies)
+    assert stats.sql_count == 1
+    assert replies == []
+
+
+def test_reply_with_question_is_one_statement(db, question, count_queries):
+    reply_id = reply_index.get_ids(db, question)[0]
+    db.expunge_all()
+    with count_queries() as stats:
+        reply = crud.get_reply_with_question(db, reply_id)
+        owner = reply.question.question
+        approved = reply.question.approved_num
+    assert stats.sql_count == 1
+    assert owner == "问题"
+    assert approved == 5
@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from __strange_you_database__ import crud, models
+from __strange_you_database__.pagination import encode_cursor, decode_key_cursor, decode_date_key_cursor
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor("1"), encode_cursor(True), encode_cursor(1.5), "!!!"])
+def test_forged_key_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_key_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor("2024-01-01", "1"), encode_cursor("x", 1), encode_cursor(1, 2)])
+def test_forged_reply_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_date_key_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def walk_replies(db, question, limit):
+    walked, after = [], None
+    while True:
+        rows = crud.get_reply_after(db, question, after, limit)
+        walked.append([row["id"] for row in rows])
+        if len(rows) < limit:
+            return walked
+        after = (rows[-1]["date"], rows[-1]["id"])
+
+
+# 页码翻页与游标翻页取到的内容一致；min_skip 为 1 时每页都走页边界缓存，
+# 缓存之后提交的新回复排在最前，深页的边界仍然正确
+@pytest.mark.parametrize("min_skip", [1, 1000])
+def test_reply_pages_match_cursor_walk(db, question, monkeypatch, min_skip):
+    monkeypatch.setattr(crud, "PAGE_INDEX_MIN_SKIP", min_skip)
+    crud.page_index.invalidate((crud.REPLY_PAGES, question))
+    today = date.today()
+    db.add_all([models.Reply(name="匿名", content="旧回复", source="202100000001", status="待审批",
+                             date=today - timedelta(days=i % 3 + 1), question_id=question) for i in range(20)])
+    db.commit()
+    crud.rebuild_reply_counters(db)
+    pages = lambda: [[row["id"] for row in crud.get_reply(db, question, page, 7)] for page in range(1, 6)]
+    assert pages()[:4] == walk_replies(db, question, 7)
+    for _ in range(3):
+        crud.create_question_reply(db, crud.ReplyCreate(name="匿名", content="新回复", question_id=question),
+                                   "202100000001")
+    assert pages()[:5] == walk_replies(db, question, 7)
+
+
+@pytest.mark.parametrize("min_skip", [1, 1000])
+def test_question_pages_after_new_submissions(db, question, monkeypatch, min_skip):
+    monkeypatch.setattr(crud, "PAGE_INDEX_MIN_SKIP", min_skip)
+    crud.page_index.invalidate(crud.QUESTION_PAGES)
+    for i in range(12):
+        crud.create_question("问题 %d" % i, "匿名", "202100000001", db)
+    assert [row["sn"] for row in crud.get_questions(db, 3, 5)] == [row["sn"] for row in
+                                                                  crud.get_questions_after(db, question + 9, 5)]
+    for i in range(6):
+        crud.create_question("新问题 %d" % i, "匿名", "202100000001", db)
+    assert crud.get_question_num(db) == 19
+    assert [row["sn"] for row in crud.get_questions(db, 4, 5)] == [row["sn"] for row in
+                                                                  crud.get_questions_after(db, question + 14, 5)]
@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+
+from __strange_you_database__ import database, models
+from __strange_you_database__.database import ReadSessionLocal, create_db_engine, primary_reads
+from __strange_you_database__.reply_index import reply_index
+from __strange_you_database__.sampler import QuestionPool
+
+
+# 两个 SQLite 只读副本，各有一个以库名命名的用户，用于判断查询发往了哪个库
+@pytest.fixture
+def replicas(db, tmp_path, monkeypatch):
+    db.add(models.User(student_number="marker", username="primary"))
+    db.commit()
+    engines = []
+    for i in range(2):
+        replica = create_db_engine("sqlite:///%s" % (tmp_path / ("replica-%d.db" % i)))
+        models.Base.metadata.create_all(bind=replica)
+        with replica.begin() as conn:
+            conn.execute(models.User.__table__.insert(), {"student_number": "marker", "username": "replica-%d" % i})
+        engines.append(replica)
+    monkeypatch.setattr(database, "replica_engines", engines)
+    yield engines
+    for replica in engines:
+        replica.dispose()
+
+
+def marker(session):
+    return session.query(models.User.username).filter(models.User.student_number == "marker").scalar()
+
+
+def test_read_session_pins_one_replica(replicas):
+    session = ReadSessionLocal()
+    try:
+        seen = {marker(session) for _ in range(20)}
+    finally:
+        session.close()
+    assert len(seen) == 1
+    assert seen <= {"replica-0", "replica-1"}
+
+
+def test_primary_reads_bypass_replicas(replicas):
+    session = ReadSessionLocal()
+    try:
+        with primary_reads():
+            assert marker(session) == "primary"
+        assert marker(session).startswith("replica-")
+    finally:
+        session.close()
+
+
+# 副本尚未同步新通过的回复和问题时，失效后的重建仍以主库为准
+def test_cache_rebuilds_read_primary(db, replicas):
+    question = models.Question(question="问题", source="marker", status="已通过", date=date.today())
+    db.add(question)
+    db.flush()
+    db.add(models.Reply(content="回复", source="marker", status="已通过", date=date.today(),
+                        question_id=question.sn))
+    db.commit()
+    session = ReadSessionLocal()
+    try:
+        reply_index.invalidate(question.sn)
+        assert len(reply_index.get_ids(session, question.sn)) == 1
+        pool = QuestionPool()
+        pool.ensure_loaded(session)
+        assert pool.sample(5) == [question.sn]
+    finally:
+        session.close()
+        reply_index.invalidate(question.sn)
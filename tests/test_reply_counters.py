@@ -0,0 +1,36 @@
+from datetime import date
+
+from __strange_you_database__ import crud, models
+
+
+# 三个已通过的问题，每个问题下两条待审批的回复
+def pending_replies(db):
+    db.add(models.User(student_number="202100000001", username="user"))
+    questions = [models.Question(question="问题 %d" % i, source="202100000001", status="已通过",
+                                 date=date.today(), pending_num=2) for i in range(3)]
+    db.add_all(questions)
+    db.flush()
+    replies = [models.Reply(content="回复", source="202100000001", status="待审批", date=date.today(),
+                            question_id=question.sn) for question in questions for _ in range(2)]
+    db.add_all(replies)
+    db.commit()
+    return [question.sn for question in questions], [reply.id for reply in replies]
+
+
+def counters(db, sn):
+    db.expire_all()
+    question = db.get(models.Question, sn)
+    return question.approved_num, question.pending_num, question.rejected_num
+
+
+# 批量审核多个问题下的回复时，回复计数只用一条 UPDATE question 调整
+def test_examine_replies_updates_counters_in_one_statement(db, count_queries):
+    question_sns, reply_ids = pending_replies(db)
+    statuses = ["已通过", "已通过", "已通过", "未通过", "未通过", "待审批"]
+    with count_queries() as stats:
+        crud.examine_replies(db, list(zip(reply_ids, statuses)))
+    # 行锁读取 1 条、计数 1 条、按状态更新回复 3 条、查询待通知的提问者 1 条
+    assert stats.sql_count == 6
+    assert counters(db, question_sns[0]) == (2, 0, 0)
+    assert counters(db, question_sns[1]) == (1, 0, 1)
+    assert counters(db, question_sns[2]) == (0, 1, 1)
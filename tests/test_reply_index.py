@@ -0,0 +1,33 @@
+import asyncio
+from datetime import date
+
+from __strange_you_database__ import models
+from __strange_you_database__.reply_index import ReplyIndex
+
+
+# 两个 ReplyIndex 模拟两个 worker：一方改动后广播，另一方丢弃索引并从主库重建，广播方不受自身通知影响
+def test_broadcast_invalidates_other_workers(db, question):
+    async def scenario():
+        worker, other = ReplyIndex(), ReplyIndex()
+        worker.start()
+        other.start()
+        try:
+            before = worker.get_ids(db, question)
+            assert other.get_ids(db, question) == before
+            reply = models.Reply(content="新回复", source="202100000001", status="已通过", date=date.today(),
+                                 question_id=question)
+            db.add(reply)
+            db.commit()
+            worker.add(question, reply.id)
+            worker.broadcast([question])
+            for _ in range(3):
+                await asyncio.sleep(0)
+            assert other.get_ids(db, question) == before + [reply.id]
+            assert worker.get_ids(db, question) == before + [reply.id]
+            assert other.stats()["remote_invalidations"] == 1
+            assert worker.stats()["remote_invalidations"] == 0
+        finally:
+            worker.stop()
+            other.stop()
+
+    asyncio.run(scenario())
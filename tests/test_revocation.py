@@ -0,0 +1,35 @@
+from __strange_you_database__.revocation import EpochStore, USER_TOKEN, MANAGER_TOKEN
+
+
+def test_bump_inserts_then_increments(db):
+    store = EpochStore()
+    assert store.bump(db, USER_TOKEN, ["a", "b"]) == {(USER_TOKEN, "a"): 1, (USER_TOKEN, "b"): 1}
+    db.commit()
+    # 已有记录加一，缺失的插入，重复的学号只算一次
+    assert store.bump(db, USER_TOKEN, ["a", "c", "a"]) == {(USER_TOKEN, "a"): 2, (USER_TOKEN, "c"): 1}
+    db.commit()
+    assert store.load(db, USER_TOKEN, "b") == 1
+    assert store.load(db, MANAGER_TOKEN, "a") == 0
+
+
+def test_revoke_rejects_older_tokens(db):
+    store = EpochStore()
+    store.refresh(db)
+    assert store.check(MANAGER_TOKEN, "admin", 0)
+    assert store.revoke(db, MANAGER_TOKEN, "admin") == 1
+    assert not store.check(MANAGER_TOKEN, "admin", 0)
+    assert store.check(MANAGER_TOKEN, "admin", 1)
+
+
+# 两个进程各有一份版本号副本：A 处理注销并签发新令牌，B 尚未刷新时也应接受新令牌、拒绝旧令牌
+def test_token_issued_by_another_worker(db):
+    worker_a, worker_b = EpochStore(), EpochStore()
+    worker_a.refresh(db)
+    worker_b.refresh(db)
+    epoch = worker_a.revoke(db, USER_TOKEN, "a")
+    assert worker_a.check(USER_TOKEN, "a", epoch)
+    assert worker_b.ahead(USER_TOKEN, "a", epoch)
+    worker_b.load(db, USER_TOKEN, "a")
+    assert not worker_b.ahead(USER_TOKEN, "a", epoch)
+    assert worker_b.check(USER_TOKEN, "a", epoch)
+    assert not worker_b.check(USER_TOKEN, "a", epoch - 1)
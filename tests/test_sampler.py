@@ -0,0 +1,44 @@
+from datetime import date
+
+from __strange_you_database__ import models
+from __strange_you_database__.sampler import QuestionPool
+
+
+def approved_question(db):
+    question = models.Question(question="问题", source="202100000001", status="已通过", date=date.today())
+    db.add(question)
+    db.commit()
+    return question.sn
+
+
+# 问题池过期后，正在有一个请求重建时，其余请求不再等待，继续使用旧池
+def test_expired_pool_serves_old_pool_while_reloading(db):
+    sn = approved_question(db)
+    pool = QuestionPool(refresh_seconds=0)
+    pool.ensure_loaded(db)
+    assert pool.loads == 1
+    with pool._load_lock:
+        pool.ensure_loaded(db)
+    assert pool.loads == 1
+    assert pool.sample(5) == [sn]
+    pool.ensure_loaded(db)
+    assert pool.loads == 2
+
+
+# 重建期间审核通过的问题在换入新池后仍然保留
+def test_add_during_load_is_replayed(db):
+    pool = QuestionPool()
+    pool.ensure_loaded(db)
+    query = db.query
+
+    def query_then_approve(*args):
+        result = query(*args)
+        pool.add(12345)
+        return result
+
+    db.query = query_then_approve
+    try:
+        pool.load(db)
+    finally:
+        del db.query
+    assert pool.sample(5) == [12345]
@@ -0,0 +1,28 @@
+from datetime import date
+
+from __strange_you_database__ import models
+from __strange_you_database__.search import LocalSearchIndex
+
+
+def approved_questions(db, contents):
+    questions = [models.Question(question=content, source="202100000001", status="已通过", date=date.today())
+                 for content in contents]
+    db.add_all(questions)
+    db.commit()
+    return [question.sn for question in questions]
+
+
+# 查询在锁外打分，持有的倒排表在之后的审核写入中保持不变
+def test_search_snapshot_unchanged_by_writes(db):
+    first, second = approved_questions(db, ["陌生的你好", "陌生人"])
+    search = LocalSearchIndex()
+    search.rebuild()
+    with search._lock:
+        snapshot = search._index.lookup("陌生")[0]
+    search.add("question", 99, "陌生的城市")
+    search.remove("question", first)
+    assert snapshot == {("question", first): 1, ("question", second): 1}
+    assert search.search(db, "陌生", None, 1, 10)[0] == 2
+    total, hits = search.search(db, "陌", "question", 1, 10)
+    assert total == 2
+    assert {doc_id for _, doc_id, _ in hits} == {second, 99}
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from __strange_you_database__ import unified_auth as unified_auth_module
+from __strange_you_database__.unified_auth import UnifiedAuthClient
+
+
+# 替代统一认证服务器：记录调用次数，可设置阻塞直到放行或返回密码错误
+class StubAuthServer:
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, username, password):
+        self.calls += 1
+        self.release.wait(5)
+        if password != "right":
+            raise HTTPException(status_code=401, detail="学号或密码错误")
+        return {"student_number": username, "name": "同学"}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    stub = StubAuthServer()
+    monkeypatch.setattr(unified_auth_module, "get_info_plus", stub)
+    yield stub
+    stub.release.set()
+
+
+@pytest.fixture
+def client():
+    client = UnifiedAuthClient(concurrency=1, timeout=0.05)
+    yield client
+    client.shutdown()
+
+
+def test_cache_hit_skips_server(server, client):
+    async def run():
+        first = await client.verify("202100000001", "right")
+        second = await client.verify("202100000001", "right")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"student_number": "202100000001", "name": "同学"}
+    assert server.calls == 1
+    assert client.stats()["hits"] == 1
+
+
+def test_bad_password_is_not_cached(server, client):
+    async def run():
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                await client.verify("202100000001", "wrong")
+            assert exc.value.status_code == 401
+
+    asyncio.run(run())
+    assert server.calls == 2
+    assert client.stats()["failures"] == 2
+
+
+def test_timeout_keeps_slot_until_worker_finishes(server, client):
+    server.release.clear()
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await client.verify("202100000001", "right")
+        assert exc.value.status_code == 504
+        # 超时的调用仍在运行，唯一的名额没有归还，下一次调用只能等待
+        assert client.stats()["in_flight"] == 1
+        with pytest.raises(HTTPException):
+            await client.verify("202100000002", "right")
+        assert server.calls == 1
+        server.release.set()
+        return await client.verify("202100000002", "right")
+
+    assert asyncio.run(run())["student_number"] == "202100000002"
+    assert server.calls == 2
+    assert client.stats()["timeouts"] == 2
+    assert client.stats()["in_flight"] == 0